@@ -5,7 +5,6 @@ import pandas as pd
 import shap
 import matplotlib.pyplot as plt
 import seaborn as sns
-from PIL import Image, ImageDraw, ImageFont
 import plotly.graph_objects as go
 import plotly.express as px
 from matplotlib.font_manager import FontProperties, fontManager
@@ -16,6 +15,17 @@ import warnings
 import matplotlib as mpl
 import io
 import base64
+import tempfile
+from feature_config import feature_ranges
+from risk_grid import RiskGrid, model_fingerprint
+from input_validation import InputValidator, POLICIES
+from report_export import (
+    compute_report_records, default_report_fonts, export_reports_zip, find_font_path, format_base_value,
+    format_feature_labels, load_report_fonts, positive_class_shap_values, render_shap_chart, report_filenames,
+    risk_band, risk_band_categories, top_feature_contributions,
+)
+from diagnostics import MemoryDiagnostics
+from surrogate_explainer import SurrogateExplainer
 warnings.filterwarnings('ignore')
 
 # 添加中文字体文件（尝试解决Streamlit云环境中的字体问题）
@@ -279,6 +289,81 @@ def load_model():
 
 model = load_model()
 
+# 模型文件指纹 - 离线产物只在由当前模型生成时使用
+@st.cache_resource
+def get_model_fingerprint():
+    try:
+        return model_fingerprint('rf1.pkl')
+    except OSError:
+        return None
+
+# 加载离线预计算的风险查找表（可选，由 risk_grid.py 生成）
+@st.cache_resource
+def load_risk_grid():
+    if not os.path.exists('risk_grid.npy') or not os.path.exists('risk_grid.json'):
+        return None
+    try:
+        grid = RiskGrid.load('risk_grid')
+    except Exception as e:
+        st.warning(f"风险查找表 'risk_grid' 加载错误: {str(e)}，将不显示实时近似风险。")
+        return None
+    if grid.model_sha256 is None or grid.model_sha256 != get_model_fingerprint():
+        st.warning("风险查找表不是由当前模型文件生成的，请重新运行 risk_grid.py，将不显示实时近似风险。")
+        return None
+    return grid
+
+risk_grid = load_risk_grid()
+
+# SHAP解释器只构建一次，供单个预测和批量报告复用
+@st.cache_resource
+def load_explainer():
+    # 诊断阶段放在缓存函数内部，只记录真正的一次构建
+    with diagnostics.stage("SHAP解释器构建"):
+        return shap.Explainer(model)
+
+# 加载离线拟合的代理解释模型（可选，由 surrogate_explainer.py 生成）
+@st.cache_resource
+def load_surrogate():
+    if not os.path.exists('surrogate_explainer.pkl'):
+        return None
+    try:
+        surrogate = SurrogateExplainer.load('surrogate_explainer.pkl')
+    except Exception as e:
+        st.warning(f"代理解释模型 'surrogate_explainer.pkl' 加载错误: {str(e)}，将只使用精确SHAP解释。")
+        return None
+    if surrogate.model_sha256 is None or surrogate.model_sha256 != get_model_fingerprint():
+        st.warning("代理解释模型不是由当前模型文件生成的，请重新运行 surrogate_explainer.py，将只使用精确SHAP解释。")
+        return None
+    if model is not None and hasattr(model, 'feature_names_in_') and surrogate.feature_order != list(model.feature_names_in_):
+        st.warning("代理解释模型的特征与当前模型不一致，将只使用精确SHAP解释。")
+        return None
+    return surrogate
+
+surrogate = load_surrogate()
+
+# 查找SHAP图和报告使用的中文字体文件（只查找/下载一次）
+@st.cache_resource
+def get_chart_font_path():
+    return find_font_path()
+
+@st.cache_resource
+def load_chart_fonts():
+    try:
+        return load_report_fonts(get_chart_font_path())
+    except Exception as font_error:
+        st.warning(f"加载字体失败: {str(font_error)}，将使用默认字体")
+        return default_report_fonts()
+
+# 内存诊断（默认关闭，设置环境变量 APP_DIAGNOSTICS=1 启用）
+@st.cache_resource
+def get_diagnostics():
+    diagnostics = MemoryDiagnostics()
+    if os.getenv('APP_DIAGNOSTICS') == '1':
+        diagnostics.start()
+    return diagnostics
+
+diagnostics = get_diagnostics()
+
 # 侧边栏配置和调试信息
 with st.sidebar:
     st.markdown("### 模型信息")
@@ -288,6 +373,71 @@ with st.sidebar:
             expected_features = model.feature_names_in_
             st.write("模型期望特征列表:", expected_features)
     
+    # 实时近似风险开关 - 仅在查找表存在时可用
+    show_live_risk = False
+    if risk_grid is not None:
+        show_live_risk = st.checkbox("实时显示近似风险", value=True, help="拖动滑块时使用预计算查找表即时估算风险，点击\"开始预测\"时仍使用模型精确计算")
+        error_report = risk_grid.error_report
+        if error_report:
+            st.caption(f"查找表近似误差: 平均 {error_report['mae']:.2f} 个百分点，P95 {error_report['p95']:.2f}，最大 {error_report['max']:.2f}（{error_report['n_samples']} 个随机样本）")
+    
+    # 管理员内存诊断面板 - 仅在诊断模式下显示
+    if diagnostics.enabled:
+        with st.expander("内存诊断（管理员）"):
+            # 生成报告需要完整的内存快照和对象扫描，只在点击按钮时计算，结果保存在会话中
+            if st.button("生成/刷新报告"):
+                st.session_state['diagnostics_report'] = diagnostics.report()
+            if st.button("重置基线"):
+                diagnostics.reset_baseline()
+                st.session_state.pop('diagnostics_report', None)
+            
+            diagnostics_report = st.session_state.get('diagnostics_report')
+            if diagnostics_report is not None:
+                st.caption(f"报告生成时间: {diagnostics_report['time']}")
+                if diagnostics_report["rss_mb"] is not None:
+                    st.metric("进程常驻内存", f"{diagnostics_report['rss_mb']:.1f} MB")
+                st.caption(f"tracemalloc 当前 {diagnostics_report['traced_current'] / 1e6:.1f} MB，峰值 {diagnostics_report['traced_peak'] / 1e6:.1f} MB")
+                
+                st.markdown("**存活对象数量**")
+                st.dataframe(pd.DataFrame([diagnostics_report["live_objects"]]), use_container_width=True)
+                if diagnostics_report["object_history"]:
+                    st.markdown("**每次预测后的对象数量**")
+                    st.dataframe(pd.DataFrame(diagnostics_report["object_history"]), use_container_width=True)
+                
+                if diagnostics_report["stages"]:
+                    st.markdown("**各预测阶段内存增长 (KB)**")
+                    st.caption("快照覆盖整个进程：多个会话同时使用时，其他会话（线程）在同一时间段内的分配也会计入该阶段，"
+                               "各阶段增长只在单用户或低负载时可靠，繁忙时请以调用位置和多次调用的趋势为参考。")
+                    st.dataframe(pd.DataFrame([
+                        {"阶段": name, "调用次数": stage["calls"], "累计增长": stage["total_growth"] / 1024, "最近一次": stage["last_growth"] / 1024}
+                        for name, stage in diagnostics_report["stages"].items()
+                    ]), use_container_width=True)
+                    st.markdown("**各阶段增长最多的代码位置**（caller 为仓库内的调用位置）")
+                    st.dataframe(pd.DataFrame([
+                        {"阶段": name, **site}
+                        for name, stage in diagnostics_report["stages"].items()
+                        for site in stage["top_sites"]
+                    ]), use_container_width=True)
+                
+                if diagnostics_report["top_growth_sites"]:
+                    st.markdown("**自基线以来增长最多的代码位置**")
+                    st.dataframe(pd.DataFrame(diagnostics_report["top_growth_sites"]), use_container_width=True)
+                
+                if st.button("保存诊断报告"):
+                    st.success(f"已保存到 {diagnostics.save(report=diagnostics_report)}")
+    
+    # 快速解释模式开关 - 仅在代理解释模型存在时可用
+    use_fast_explanation = False
+    if surrogate is not None:
+        use_fast_explanation = st.checkbox("快速解释模式", value=False, help="使用离线拟合的代理模型近似SHAP值；单个输入的保真度低于阈值时自动改用精确SHAP")
+        fidelity = surrogate.fidelity
+        if fidelity:
+            st.caption(f"代理解释保真度: R² {fidelity['r2']:.3f}，前3特征一致 {fidelity['top3_agreement']:.1%}（{fidelity['n_holdout']} 个留出样本，与精确SHAP比较）；保真度阈值 {surrogate.threshold}")
+            # 单个输入的保真度只检查可加性，实际走快速路径的输入的留出 R² 才反映界面中显示的解释质量
+            r2_fast_path = f"{fidelity['r2_fast_path']:.3f}" if fidelity.get('r2_fast_path') is not None else "-"
+            st.caption(f"留出样本中 {fidelity.get('fast_path_rate', 0.0):.1%} 达到阈值、使用代理解释，其 R² {r2_fast_path}。"
+                       "单个输入的保真度只检查 基准值+ΣSHAP 是否等于模型概率，无法发现总和正确但各特征分配有误的情况。")
+    
     st.markdown("---")
     st.markdown("### 应用说明")
     st.markdown("""
@@ -299,24 +449,6 @@ with st.sidebar:
     3. 查看预测结果与解释
     """)
 
-# 特征范围定义
-feature_ranges = {
-    "术中出血量": {"type": "numerical", "min": 0.000, "max": 800.000, "default": 50, 
-                                 "description": "手术期间的出血量 (ml)", "unit": "ml"},
-    "CEA": {"type": "numerical", "min": 0, "max": 150.000, "default": 8.68, 
-           "description": "癌胚抗原水平", "unit": "ng/ml"},
-    "白蛋白": {"type": "numerical", "min": 1.0, "max": 80.0, "default": 38.60, 
-               "description": "血清白蛋白水平", "unit": "g/L"},
-    "TNM分期": {"type": "categorical", "options": [1, 2, 3, 4], "default": 2, 
-                 "description": "肿瘤分期", "unit": ""},
-    "年龄": {"type": "numerical", "min": 25, "max": 90, "default": 76, 
-           "description": "患者年龄", "unit": "岁"},
-    "术中肿瘤最大直径": {"type": "numerical", "min": 0.2, "max": 20, "default": 4, 
-                          "description": "肿瘤最大直径", "unit": "cm"},
-    "淋巴血管侵犯": {"type": "categorical", "options": [0, 1], "default": 1, 
-                              "description": "淋巴血管侵犯 (0=否, 1=是)", "unit": ""},
-}
-
 # 特征顺序定义 - 确保与模型训练时的顺序一致
 if model is not None and hasattr(model, 'feature_names_in_'):
     feature_input_order = list(model.feature_names_in_)
@@ -341,6 +473,9 @@ else:
     # 如果模型没有feature_names_in_属性，使用原来的顺序
     feature_input_order = list(feature_ranges.keys())
 
+# 由特征范围生成的输入校验器 - 单个输入与批量文件输入共用
+input_validator = InputValidator(feature_ranges, feature_input_order)
+
 # 应用标题和描述
 st.markdown('<h1 class="main-header">胃癌术后三年生存预测模型</h1>', unsafe_allow_html=True)
 
@@ -404,6 +539,16 @@ with col1:
                 
         feature_values[feature] = value
     
+    # 实时近似风险 - 查找表插值，不调用模型
+    if show_live_risk and set(risk_grid.feature_order) == set(feature_values):
+        approx_probability = risk_grid.lookup_one(feature_values) * 100
+        st.markdown(f"""
+        <div class="progress-container" style="text-align: center;">
+            <span style="font-size: 0.9rem; color: #1E3A8A;">近似三年死亡风险（实时估算）: </span>
+            <span style="font-size: 1.0rem; font-weight: bold; color: #EF4444;">{approx_probability:.1f}%</span>
+        </div>
+        """, unsafe_allow_html=True)
+    
     # 预测按钮
     predict_button = st.button("开始预测", help="点击生成预测结果")
     st.markdown('</div>', unsafe_allow_html=True)
@@ -427,14 +572,21 @@ with col2:
             # 按模型训练时的特征顺序重排列特征
             features_df = features_df[model.feature_names_in_]
         
+        # 校验输入值是否在允许范围内
+        validation = input_validator.validate(features_df)
+        if not validation.row_valid[0]:
+            st.error(f"输入数据校验未通过: {'; '.join(validation.row_messages(0))}")
+            st.stop()
+        
         # 转换为numpy数组
         features_array = features_df.values
         
         with st.spinner("计算预测结果..."):
             try:
                 # 模型预测
-                predicted_class = model.predict(features_array)[0]
-                predicted_proba = model.predict_proba(features_array)[0]
+                with diagnostics.stage("模型预测"):
+                    predicted_class = model.predict(features_array)[0]
+                    predicted_proba = model.predict_proba(features_array)[0]
                 
                 # 提取预测的类别概率
                 death_probability = predicted_proba[1] * 100  # 假设1表示死亡类
@@ -471,14 +623,7 @@ with col2:
                 st.plotly_chart(fig, use_container_width=True)
                 
                 # 创建风险类别显示
-                risk_category = "低风险"
-                risk_color = "green"
-                if death_probability > 30 and death_probability <= 70:
-                    risk_category = "中等风险"
-                    risk_color = "orange"
-                elif death_probability > 70:
-                    risk_category = "高风险"
-                    risk_color = "red"
+                risk_category, risk_color = risk_band(death_probability)
                 
                 # 显示风险类别和概率 - 使用浅色背景代替白色
                 st.markdown(f"""
@@ -511,241 +656,47 @@ with col2:
                 
                 try:
                     with st.spinner("正在生成SHAP解释图..."):
-                        # 使用最新版本的SHAP API，采用最简洁、最兼容的方式
-                        explainer = shap.Explainer(model)
-                        
-                        # 计算SHAP值
-                        shap_values = explainer(features_df)
-                        
-                        # 提取特征名称和SHAP值
                         feature_names = list(features_df.columns)
-                        if hasattr(shap_values, 'values') and len(shap_values.values.shape) > 2:
-                            # 多分类情况 - 选择第二个类别(通常是正类/死亡类)
-                            shap_vals = shap_values[0, :, 1].values
-                        else:
-                            # 二分类或回归情况
-                            if hasattr(shap_values, 'values'):
-                                shap_vals = shap_values[0].values
+                        shap_vals = None
+                        
+                        # 快速解释模式 - 代理模型查表，保真度不足时回退到精确SHAP
+                        if use_fast_explanation:
+                            with diagnostics.stage("代理解释"):
+                                surrogate_vals, local_fidelity = surrogate.explain_one(feature_values, predicted_proba[1])
+                            if local_fidelity >= surrogate.threshold:
+                                shap_vals = surrogate_vals
+                                base_value_formatted = format_base_value(surrogate.base_value)
+                                st.caption(f"快速解释（代理模型），本次输入保真度 {local_fidelity:.2f}")
                             else:
-                                shap_vals = shap_values[0]
-                        
-                        # 创建特征重要性DataFrame
-                        importance_df = pd.DataFrame({
-                            '特征': feature_names,
-                            'SHAP值': shap_vals,
-                            '绝对值': np.abs(shap_vals)
-                        })
+                                st.caption(f"本次输入代理解释保真度 {local_fidelity:.2f} 低于阈值 {surrogate.threshold}，已使用精确SHAP")
                         
-                        # 按绝对值排序并选择前7个特征
-                        importance_df = importance_df.sort_values('绝对值', ascending=False).head(7)
-                        
-                        # 计算基准值
-                        base_value = explainer.expected_value
-                        if isinstance(base_value, np.ndarray) and len(base_value) > 1:
-                            base_value = base_value[1]  # 假设是二分类，取第二个类别
-                        elif isinstance(base_value, list) and len(base_value) > 1:
-                            base_value = base_value[1]
-                            
-                        if isinstance(base_value, np.ndarray) and base_value.size == 1:
-                            base_value = float(base_value.item())
-                        
-                        # 格式化为小数点后3位
-                        try:
-                            base_value_formatted = float(f"{base_value:.3f}")
-                        except:
-                            base_value_formatted = 0.5  # 默认值
-                        
-                        # 准备特征标签和值
-                        feature_labels_with_values = []
-                        for i, row in importance_df.iterrows():
-                            feature = row['特征']
-                            # 获取该特征的值
-                            if feature in feature_values:
-                                value = feature_values[feature]
-                                # 处理分类特征
-                                if feature == "TNM分期":
-                                    value_display = f"{int(value)}期"
-                                elif feature == "淋巴血管侵犯":
-                                    value_display = "是" if value == 1 else "否"
-                                else:
-                                    value_display = f"{value}"
-                                feature_labels_with_values.append(f"{value_display} = {feature}")
-                            else:
-                                feature_labels_with_values.append(feature)
-                        
-                        # 我们将仅绘制不带中文标签的简单条形图
-                        plt.figure(figsize=(8, 4), dpi=100, facecolor='white')
-                        
-                        # 按照索引排列
-                        y_pos = np.arange(len(feature_labels_with_values))
-                        
-                        # 绘制水平条形图，使用序号代替中文标签
-                        colors = ['#ff4d4d' if x > 0 else '#2196F3' for x in importance_df['SHAP值']]
-                        bars = plt.barh(y_pos, importance_df['SHAP值'].values, color=colors, alpha=0.8)
-                        
-                        # 设置Y轴为数字标签（暂时）
-                        plt.yticks(y_pos, range(len(feature_labels_with_values)))
-                        
-                        # 添加垂直中轴线
-                        plt.axvline(x=0, color='gray', linestyle='-', alpha=0.3)
-                        
-                        # 设置X轴范围
-                        max_val = max(abs(importance_df['SHAP值'])) * 1.2
-                        plt.xlim(-max_val, max_val)
-                        
-                        # 添加X轴标签
-                        plt.xlabel("SHAP值", fontsize=10)
-                        
-                        # 美化图表
-                        plt.grid(axis='x', linestyle='--', alpha=0.3)
-                        plt.box(False)  # 移除边框
-                        
-                        # 使用紧凑布局
-                        plt.tight_layout()
-                        
-                        # 保存基本图表到内存中
-                        buf = io.BytesIO()
-                        plt.savefig(buf, format='png', dpi=100)
-                        plt.close()
-                        
-                        # 使用PIL打开图像
-                        buf.seek(0)
-                        img = Image.open(buf)
-                        
-                        # 创建一个全新的白色画布，更大，以便有足够空间放置文本
-                        canvas_width = 800
-                        canvas_height = 500
-                        canvas = Image.new('RGB', (canvas_width, canvas_height), 'white')
-                        
-                        # 将原始条形图粘贴到新画布中间部分
-                        graph_paste_x = 250  # 左侧留出足够空间放置特征标签
-                        graph_paste_y = 50   # 顶部留出空间放置标题
-                        canvas.paste(img, (graph_paste_x, graph_paste_y))
-                        
-                        # 创建绘图对象
-                        draw = ImageDraw.Draw(canvas)
-                        
-                        # 尝试加载中文字体
-                        try:
-                            # 尝试加载字体
-                            font_path = None
-                            # 在Windows上查找常见中文字体
-                            if platform.system() == 'Windows':
-                                for path in [
-                                    "C:\\Windows\\Fonts\\msyh.ttc",    # 微软雅黑
-                                    "C:\\Windows\\Fonts\\simhei.ttf",  # 黑体
-                                    "C:\\Windows\\Fonts\\simsun.ttc"   # 宋体
-                                ]:
-                                    if os.path.exists(path):
-                                        font_path = path
-                                        break
-                            else:
-                                # 在Linux/MacOS上尝试常见中文字体
-                                for path in [
-                                    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
-                                    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
-                                    "/System/Library/Fonts/STHeiti Light.ttc"
-                                ]:
-                                    if os.path.exists(path):
-                                        font_path = path
-                                        break
-                            
-                            # 如果未找到字体，使用Streamlit提供的默认sans-serif字体
-                            if font_path is None:
-                                # 创建临时字体文件
-                                import tempfile
-                                tmp_dir = tempfile.mkdtemp()
-                                try:
-                                    # 从GitHub下载思源黑体
-                                    import urllib.request
-                                    font_url = "https://github.com/adobe-fonts/source-han-sans/raw/release/OTF/SimplifiedChinese/SourceHanSansSC-Regular.otf"
-                                    font_path = os.path.join(tmp_dir, "SourceHanSansSC-Regular.otf")
-                                    urllib.request.urlretrieve(font_url, font_path)
-                                except:
-                                    # 使用系统默认
-                                    font_path = "DejaVuSans.ttf"
+                        if shap_vals is None:
+                            # 使用最新版本的SHAP API，采用最简洁、最兼容的方式
+                            explainer = load_explainer()
                             
-                            # 加载字体
-                            title_font = ImageFont.truetype(font_path, 20)
-                            feature_font = ImageFont.truetype(font_path, 15)
-                            value_font = ImageFont.truetype(font_path, 13)
-                            small_font = ImageFont.truetype(font_path, 12)
-                        except Exception as font_error:
-                            st.warning(f"加载字体失败: {str(font_error)}，将使用默认字体")
-                            # 使用PIL默认字体
-                            title_font = ImageFont.load_default()
-                            feature_font = ImageFont.load_default()
-                            value_font = ImageFont.load_default()
-                            small_font = ImageFont.load_default()
-                        
-                        # 添加标题
-                        title_text = "特征对预测的影响"
-                        title_width = draw.textlength(title_text, font=title_font)
-                        draw.text((canvas_width // 2 - title_width // 2, 15), title_text, fill="black", font=title_font)
-                        
-                        # 根据条形图在新画布中的位置计算条形图的Y坐标范围
-                        # 假设条形图在原始图像中占据了大部分高度
-                        graph_height = img.height * 0.7  # 条形图在原始图像中的高度比例
-                        bar_area_top = graph_paste_y + img.height * 0.15  # 条形图在原始图像中的顶部位置
-                        bar_area_bottom = bar_area_top + graph_height
-                        
-                        # 计算每个条形的高度和位置
-                        num_bars = len(feature_labels_with_values)
-                        bar_height = graph_height / num_bars
-                        
-                        # 添加特征标签到左侧，确保与条形图对齐
-                        for i, label in enumerate(feature_labels_with_values):
-                            # 计算当前条形的中心Y坐标
-                            bar_center_y = bar_area_top + i * bar_height + bar_height / 2
-                            # 右对齐文本
-                            label_width = draw.textlength(label, font=feature_font)
-                            draw.text((graph_paste_x - label_width - 10, bar_center_y - 10), label, fill="black", font=feature_font)
-                        
-                        # 计算SHAP值的位置和显示
-                        center_x = graph_paste_x + img.width / 2  # 图表中心X坐标
-                        graph_width = img.width * 0.7  # 估计条形图在原图中的宽度
-                        
-                        for i, value in enumerate(importance_df['SHAP值']):
-                            # 计算当前条形的中心Y坐标
-                            bar_center_y = bar_area_top + i * bar_height + bar_height / 2
+                            # 计算SHAP值
+                            with diagnostics.stage("SHAP计算"):
+                                shap_values = explainer(features_df)
                             
-                            # 为正负值选择不同的位置
-                            if value > 0:
-                                # 正值在条形图右侧
-                                x_position = center_x + (value / max_val) * (graph_width / 2) + 5
-                                text = f"+{value:.2f}"
-                                draw.text((x_position, bar_center_y - 8), text, fill="black", font=value_font)
+                            # 提取SHAP值
+                            if hasattr(shap_values, 'values'):
+                                shap_vals = positive_class_shap_values(shap_values.values)[0]
                             else:
-                                # 负值在条形图左侧
-                                x_position = center_x + (value / max_val) * (graph_width / 2) - 5
-                                text = f"{value:.2f}"
-                                text_width = draw.textlength(text, font=value_font)
-                                draw.text((x_position - text_width, bar_center_y - 8), text, fill="black", font=value_font)
-                        
-                        # 添加X轴标签
-                        x_label = "SHAP值"
-                        x_label_width = draw.textlength(x_label, font=feature_font)
-                        draw.text((center_x - x_label_width / 2, bar_area_bottom + 20), x_label, fill="black", font=feature_font)
-                        
-                        # 添加基准值文本
-                        base_text = f"基准值 f(x) = {base_value_formatted}"
-                        draw.text((20, canvas_height - 30), base_text, fill="black", font=small_font)
-                        
-                        # 添加图例
-                        legend_y1 = canvas_height - 60
-                        legend_y2 = canvas_height - 40
+                                shap_vals = shap_values[0]
+                            
+                            # 计算基准值，格式化为小数点后3位
+                            base_value_formatted = format_base_value(explainer.expected_value)
                         
-                        # 红色方块 - 增加风险
-                        draw.rectangle([(canvas_width - 180, legend_y1), (canvas_width - 160, legend_y1 + 15)], fill="#ff4d4d")
-                        draw.text((canvas_width - 155, legend_y1), "增加风险", fill="black", font=small_font)
+                        # 按绝对值排序并选择前7个特征
+                        top_features, top_shap_vals = top_feature_contributions(feature_names, shap_vals, k=7)
                         
-                        # 蓝色方块 - 降低风险
-                        draw.rectangle([(canvas_width - 180, legend_y2), (canvas_width - 160, legend_y2 + 15)], fill="#2196F3")
-                        draw.text((canvas_width - 155, legend_y2), "降低风险", fill="black", font=small_font)
+                        # 准备特征标签和值
+                        feature_labels_with_values = format_feature_labels(top_features, feature_values)
                         
-                        # 保存和显示最终图像
-                        canvas.save("shap_effect_plot_final.png")
-                        st.image("shap_effect_plot_final.png")
+                        # 绘制条形图并在左侧添加中文特征标签
+                        with diagnostics.stage("SHAP绘图"):
+                            canvas = render_shap_chart(feature_labels_with_values, top_shap_vals, base_value_formatted, load_chart_fonts())
+                            st.image(canvas)
                         
                         # 添加简要解释 - 更紧凑，使用浅色背景
                         st.markdown("""
@@ -761,11 +712,115 @@ with col2:
             except Exception as e:
                 st.error(f"预测过程中发生错误: {str(e)}")
                 st.warning("请检查输入数据是否与模型期望的特征匹配，或联系开发人员获取支持。")
+        diagnostics.record_live_objects()
         st.markdown('</div>', unsafe_allow_html=True)
     else:
         # 当没有点击预测按钮时，不显示任何内容
         pass
 
+# 批量预测 - 上传患者数据文件，校验后批量计算风险
+if model is not None:
+    with st.expander("批量预测（上传CSV文件）"):
+        uploaded_file = st.file_uploader("上传患者数据（CSV，列名与特征名称一致）", type=["csv"])
+        policy_display = {"reject": "拒绝该行", "clip": "截断到允许范围"}
+        validation_policy = st.radio(
+            "超出范围的数值",
+            options=list(POLICIES),
+            format_func=lambda x: policy_display[x],
+            horizontal=True
+        )
+        if uploaded_file is not None:
+            try:
+                cohort_df = pd.read_csv(uploaded_file)
+            except Exception as e:
+                st.error(f"读取文件失败: {str(e)}")
+                cohort_df = None
+            
+            if cohort_df is not None:
+                validation = input_validator.validate(cohort_df, policy=validation_policy)
+                st.write(f"共 {validation.n_rows} 行，通过校验 {validation.n_valid} 行")
+                
+                # 显示各字段的错误统计和部分未通过的行
+                error_summary = validation.summary()
+                error_summary = error_summary[error_summary.sum(axis=1) > 0]
+                if not error_summary.empty:
+                    st.markdown("**各字段错误统计（行数）**")
+                    st.dataframe(error_summary, use_container_width=True)
+                    rejected_positions = np.flatnonzero(~validation.row_valid)[:100]
+                    if len(rejected_positions):
+                        rejected_df = cohort_df.iloc[rejected_positions].copy()
+                        rejected_df["错误"] = ["; ".join(validation.row_messages(i)) for i in rejected_positions]
+                        st.markdown("**未通过校验的行（最多显示100行）**")
+                        st.dataframe(rejected_df, use_container_width=True)
+                
+                if validation.n_valid:
+                    accepted_df = validation.accepted()
+                    with diagnostics.stage("批量预测"):
+                        cohort_probability = model.predict_proba(accepted_df)[:, 1] * 100
+                    cohort_results = cohort_df.loc[accepted_df.index].copy()
+                    # 患者编号：优先使用文件中的"患者编号"列，否则使用原文件中的行号，与报告文件名对应
+                    if "患者编号" in cohort_results.columns:
+                        patient_ids = cohort_results["患者编号"]
+                    else:
+                        patient_ids = accepted_df.index + 1
+                        cohort_results.insert(0, "患者编号", patient_ids)
+                    # clip 策略下被截断的行也通过校验，逐行注明原始值的问题（预测使用截断后的值）
+                    accepted_positions = np.flatnonzero(validation.row_valid)
+                    flagged = validation.error_mask().any(axis=1)[accepted_positions]
+                    validation_notes = np.full(len(accepted_positions), "", dtype=object)
+                    for k in np.flatnonzero(flagged):
+                        validation_notes[k] = "; ".join(validation.row_messages(accepted_positions[k])) + "（已截断）"
+                    cohort_results["校验说明"] = validation_notes
+                    cohort_results["三年死亡风险(%)"] = np.round(cohort_probability, 1)
+                    cohort_results["风险类别"] = risk_band_categories(cohort_probability)
+                    st.dataframe(cohort_results, use_container_width=True)
+                    st.download_button(
+                        "下载批量预测结果",
+                        data=cohort_results.to_csv(index=False).encode('utf-8-sig'),
+                        file_name="cohort_predictions.csv",
+                        mime="text/csv"
+                    )
+                    
+                    # 为每位患者生成报告（仪表盘、风险类别、概率、SHAP图和免责声明），打包为ZIP
+                    if st.button("生成患者报告 (ZIP)"):
+                        # 文件中的患者编号重复或缺失时，报告文件名加上原文件行号，避免 ZIP 中出现同名文件
+                        report_names, disambiguated = report_filenames(patient_ids, rows=accepted_df.index + 1)
+                        if disambiguated:
+                            st.warning("患者编号存在重复或缺失，报告文件名已加上原文件行号（例如 report_3_P001.png）")
+                        export_progress = st.progress(0.0, text="正在生成患者报告...")
+                        
+                        def update_export_progress(done, total):
+                            export_progress.progress(done / total, text=f"正在生成患者报告... {done}/{total}")
+                        
+                        report_zip_path = None
+                        try:
+                            # 报告逐个写入磁盘上的临时ZIP文件，不在内存中拼装整个压缩包
+                            with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as report_zip:
+                                report_zip_path = report_zip.name
+                                with diagnostics.stage("报告导出"):
+                                    export_reports_zip(
+                                        compute_report_records(model, accepted_df, patient_ids=patient_ids,
+                                                               explainer=load_explainer(), filenames=report_names),
+                                        report_zip,
+                                        total=len(accepted_df),
+                                        progress=update_export_progress,
+                                        font_path=get_chart_font_path(),
+                                        mpl_fonts=font_list
+                                    )
+                            # download_button 只接受 bytes、BytesIO、BufferedReader 等类型，关闭后以只读方式重新打开
+                            with open(report_zip_path, "rb") as report_file:
+                                st.download_button(
+                                    "下载患者报告",
+                                    data=report_file,
+                                    file_name="patient_reports.zip",
+                                    mime="application/zip"
+                                )
+                        except Exception as export_error:
+                            st.error(f"生成患者报告时出错: {str(export_error)}")
+                        finally:
+                            if report_zip_path is not None and os.path.exists(report_zip_path):
+                                os.remove(report_zip_path)
+
 # 添加页脚说明
 st.markdown("""
 <div class="disclaimer">
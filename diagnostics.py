@@ -0,0 +1,207 @@
+# 内存诊断：按预测阶段记录 tracemalloc 内存分配增长，并统计主要对象类型的存活数量。
+#
+# 默认关闭，设置环境变量 APP_DIAGNOSTICS=1 后启用（tracemalloc 会明显增加内存与耗时开销）。
+# 启用后侧边栏显示管理员诊断面板，可将报告保存为 JSON 文件。
+#
+# 局限：tracemalloc 快照覆盖整个进程，而 Streamlit 的每个会话在各自的线程中运行。
+# 多个会话同时预测时，某一阶段前后两次快照之间其他线程的分配也会计入该阶段，
+# 因此各阶段的增长量只在单用户或低负载时可靠；繁忙的服务器上应结合调用位置与多次调用的趋势判断。
+import gc
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# 需要统计存活数量的对象类型：(显示名称, 模块名, 类名)
+# 只在对应模块已被导入时统计，不会为诊断额外导入依赖
+TRACKED_TYPES = [
+    ("matplotlib Figure", "matplotlib.figure", "Figure"),
+    ("PIL Image", "PIL.Image", "Image"),
+    ("SHAP Explainer", "shap", "Explainer"),
+    ("pandas DataFrame", "pandas", "DataFrame"),
+]
+
+# 不计入统计的内部分配（tracemalloc 自身与导入机制）
+_TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def _current_rss_mb():
+    # 当前进程常驻内存 (MB)；非 Linux 系统上退回到峰值 RSS
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS 上单位为字节，Linux 上为 KB
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        return None
+
+
+# 仓库根目录 - 用于在调用栈中找到仓库内发起分配的代码位置
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _site(stat):
+    # 返回 (分配发生的代码行, 调用栈中最近的仓库内代码行)；Traceback 按从旧到新排列
+    frames = list(stat.traceback)
+    site = f"{frames[-1].filename}:{frames[-1].lineno}"
+    caller = None
+    for frame in reversed(frames):
+        # "<frozen abc>" 之类的伪文件名不是仓库代码
+        if frame.filename.startswith("<"):
+            continue
+        path = os.path.abspath(frame.filename)
+        if path.startswith(_REPO_DIR + os.sep) and path != os.path.abspath(__file__):
+            caller = f"{os.path.relpath(path, _REPO_DIR)}:{frame.lineno}"
+            break
+    return site, caller
+
+
+def _aggregate(diff, top_n):
+    # 按 (仓库内调用位置, 分配位置) 合并按调用栈分组的差异，返回增长最多的 top_n 项
+    sites = {}
+    for stat in diff:
+        site, caller = _site(stat)
+        entry = sites.setdefault((caller, site), {"caller": caller, "site": site, "size_diff": 0, "size": 0, "count_diff": 0})
+        entry["size_diff"] += stat.size_diff
+        entry["size"] += stat.size
+        entry["count_diff"] += stat.count_diff
+    return sorted(sites.values(), key=lambda s: s["size_diff"], reverse=True)[:top_n]
+
+
+def live_object_counts():
+    # 统计 TRACKED_TYPES 中各类型当前存活的对象数量
+    types = []
+    for label, module_name, class_name in TRACKED_TYPES:
+        module = sys.modules.get(module_name)
+        cls = getattr(module, class_name, None) if module is not None else None
+        if isinstance(cls, type):
+            types.append((label, cls))
+    counts = {label: 0 for label, _ in types}
+    gc.collect()
+    for obj in gc.get_objects():
+        for label, cls in types:
+            if isinstance(obj, cls):
+                counts[label] += 1
+    return counts
+
+
+class MemoryDiagnostics:
+    def __init__(self, top_n=15, frames=25, history_size=200):
+        self.top_n = top_n
+        self.frames = frames
+        self.enabled = False
+        self.baseline = None
+        self.stage_stats = {}
+        self.object_history = []
+        self.history_size = history_size
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.enabled = True
+        self.reset_baseline()
+
+    def stop(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def reset_baseline(self):
+        with self._lock:
+            self.baseline = self._snapshot()
+            self.stage_stats = {}
+            self.object_history = []
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+
+    @contextmanager
+    def stage(self, name):
+        # 记录代码块执行前后的内存分配差异；未启用时不做任何事
+        if not self.enabled:
+            yield
+            return
+        before = self._snapshot()
+        try:
+            yield
+        finally:
+            diff = self._snapshot().compare_to(before, "traceback")
+            growth = sum(stat.size_diff for stat in diff)
+            top_sites = _aggregate(diff, self.top_n)
+            with self._lock:
+                stats = self.stage_stats.setdefault(name, {"calls": 0, "total_growth": 0, "last_growth": 0, "sites": {}})
+                stats["calls"] += 1
+                stats["total_growth"] += growth
+                stats["last_growth"] = growth
+                for entry in top_sites:
+                    site = stats["sites"].setdefault((entry["caller"], entry["site"]), {"size_diff": 0, "count_diff": 0})
+                    site["size_diff"] += entry["size_diff"]
+                    site["count_diff"] += entry["count_diff"]
+
+    def record_live_objects(self):
+        # 记录一次存活对象数量（例如每次预测结束后），用于观察是否持续增长
+        if not self.enabled:
+            return None
+        entry = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "rss_mb": _current_rss_mb(), **live_object_counts()}
+        with self._lock:
+            self.object_history.append(entry)
+            del self.object_history[:-self.history_size]
+        return entry
+
+    def top_growth_sites(self, top_n=None):
+        # 自基线以来内存增长最多的代码位置
+        if not self.enabled or self.baseline is None:
+            return []
+        diff = self._snapshot().compare_to(self.baseline, "traceback")
+        return _aggregate(diff, top_n or self.top_n)
+
+    def report(self):
+        with self._lock:
+            stages = {
+                name: {
+                    "calls": stats["calls"],
+                    "total_growth": stats["total_growth"],
+                    "last_growth": stats["last_growth"],
+                    "top_sites": sorted(
+                        ({"caller": caller, "site": site, **values} for (caller, site), values in stats["sites"].items()),
+                        key=lambda s: s["size_diff"], reverse=True,
+                    )[:self.top_n],
+                }
+                for name, stats in self.stage_stats.items()
+            }
+            object_history = list(self.object_history)
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "rss_mb": _current_rss_mb(),
+            "traced_current": current,
+            "traced_peak": peak,
+            "stages": stages,
+            "live_objects": live_object_counts(),
+            "object_history": object_history,
+            "top_growth_sites": self.top_growth_sites(),
+        }
+
+    def save(self, directory="diagnostics", report=None):
+        # 将诊断报告保存为 JSON 文件，返回文件路径
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"memory_report_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report or self.report(), f, ensure_ascii=False, indent=2)
+        return path
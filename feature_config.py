@@ -0,0 +1,17 @@
+# 特征范围定义 - APP4.py 与离线工具（风险查找表等）共用同一份定义
+feature_ranges = {
+    "术中出血量": {"type": "numerical", "min": 0.000, "max": 800.000, "default": 50,
+                                 "description": "手术期间的出血量 (ml)", "unit": "ml"},
+    "CEA": {"type": "numerical", "min": 0, "max": 150.000, "default": 8.68,
+           "description": "癌胚抗原水平", "unit": "ng/ml"},
+    "白蛋白": {"type": "numerical", "min": 1.0, "max": 80.0, "default": 38.60,
+               "description": "血清白蛋白水平", "unit": "g/L"},
+    "TNM分期": {"type": "categorical", "options": [1, 2, 3, 4], "default": 2,
+                 "description": "肿瘤分期", "unit": ""},
+    "年龄": {"type": "numerical", "min": 25, "max": 90, "default": 76,
+           "description": "患者年龄", "unit": "岁"},
+    "术中肿瘤最大直径": {"type": "numerical", "min": 0.2, "max": 20, "default": 4,
+                          "description": "肿瘤最大直径", "unit": "cm"},
+    "淋巴血管侵犯": {"type": "categorical", "options": [0, 1], "default": 1,
+                              "description": "淋巴血管侵犯 (0=否, 1=是)", "unit": ""},
+}
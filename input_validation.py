@@ -0,0 +1,216 @@
+# 输入校验：由 feature_ranges 生成校验规则，对单个或批量输入按列做向量化检查。
+#
+# 每个字段的检查结果是一个 uint8 错误码数组（每行一个，按位组合），
+# 超出范围的数值可按策略截断 (clip) 或整行拒绝 (reject)。
+# 命令行用法：
+#     python input_validation.py patients.csv --policy clip --out cleaned.csv
+#     python input_validation.py --benchmark --rows 1000000
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from feature_config import feature_ranges
+
+# 错误码（按位组合）
+MISSING = 1         # 缺失值或缺少该列
+NON_NUMERIC = 2     # 无法解析为数值
+BELOW_MIN = 4       # 低于最小值
+ABOVE_MAX = 8       # 高于最大值
+INVALID_OPTION = 16  # 不在分类选项中
+
+ERROR_LABELS = {
+    MISSING: "缺失",
+    NON_NUMERIC: "非数值",
+    BELOW_MIN: "低于最小值",
+    ABOVE_MAX: "高于最大值",
+    INVALID_OPTION: "无效选项",
+}
+
+POLICIES = ("reject", "clip")
+# clip 策略下越界值被截断，只有以下错误会导致整行被拒绝
+CLIP_BLOCKING = MISSING | NON_NUMERIC | INVALID_OPTION
+
+
+def _to_float(column):
+    # 转换为 float64，同时返回原始缺失掩码与无法解析的掩码
+    if pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+        values = column.to_numpy(dtype=np.float64, na_value=np.nan)
+        missing = np.isnan(values)
+        non_numeric = ~missing & ~np.isfinite(values)
+        if non_numeric.any():
+            # to_numpy 可能返回原数据的视图，不能原地修改
+            values = np.where(non_numeric, np.nan, values)
+        return values, missing, non_numeric
+    missing = column.isna().to_numpy()
+    if column.dtype == object:
+        # 去除字符串两端空白，空字符串视为缺失
+        stripped = column.str.strip() if pd.api.types.is_string_dtype(column) else column
+        missing |= (stripped == "").to_numpy()
+    values = pd.to_numeric(column, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    non_numeric = ~missing & ~np.isfinite(values)
+    values[missing | non_numeric] = np.nan
+    return values, missing, non_numeric
+
+
+class ValidationResult:
+    def __init__(self, errors, row_valid, clean, policy):
+        self.errors = errors        # {特征名: uint8 错误码数组}
+        self.row_valid = row_valid  # 每行是否通过校验（按策略）
+        self.clean = clean          # float64 DataFrame，按特征顺序排列；clip 策略下已截断
+        self.policy = policy
+
+    @property
+    def n_rows(self):
+        return len(self.row_valid)
+
+    @property
+    def n_valid(self):
+        return int(self.row_valid.sum())
+
+    def error_mask(self, code=None):
+        # 每行、每字段的布尔错误掩码 (n_rows, n_features)；code 为 None 时表示任一错误
+        codes = np.column_stack([self.errors[f] for f in self.clean.columns])
+        return codes != 0 if code is None else (codes & code) != 0
+
+    def accepted(self):
+        return self.clean[self.row_valid]
+
+    def summary(self):
+        # 每个字段各类错误的行数
+        rows = {}
+        for feature, codes in self.errors.items():
+            rows[feature] = {label: int(np.count_nonzero(codes & code)) for code, label in ERROR_LABELS.items()}
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+    def row_messages(self, index):
+        # 第 index 行的错误说明列表，例如 "CEA: 高于最大值"
+        messages = []
+        for feature, codes in self.errors.items():
+            code = int(codes[index])
+            for bit, label in ERROR_LABELS.items():
+                if code & bit:
+                    messages.append(f"{feature}: {label}")
+        return messages
+
+
+class InputValidator:
+    # 由 feature_ranges 编译得到的校验器，可复用于单个输入与批量输入
+
+    def __init__(self, ranges=None, feature_order=None):
+        ranges = feature_ranges if ranges is None else ranges
+        self.feature_order = list(ranges.keys()) if feature_order is None else list(feature_order)
+        self.rules = []
+        for feature in self.feature_order:
+            properties = ranges[feature]
+            if properties["type"] == "categorical":
+                self.rules.append((feature, "categorical", np.asarray(sorted(properties["options"]), dtype=np.float64)))
+            else:
+                self.rules.append((feature, "numerical", (float(properties["min"]), float(properties["max"]))))
+
+    def validate(self, data, policy="reject"):
+        # data: DataFrame、{特征名: 数组} 或 {特征名: 标量}（单个患者）
+        if policy not in POLICIES:
+            raise ValueError(f"未知的校验策略: {policy}，可选: {POLICIES}")
+        if not isinstance(data, pd.DataFrame):
+            if all(np.ndim(v) == 0 for v in data.values()):
+                data = {k: [v] for k, v in data.items()}
+            data = pd.DataFrame(data)
+        n_rows = len(data)
+
+        errors = {}
+        clean = {}
+        reject = np.zeros(n_rows, dtype=bool)
+        for feature, kind, rule in self.rules:
+            codes = np.zeros(n_rows, dtype=np.uint8)
+            if feature not in data.columns:
+                codes[:] = MISSING
+                values = np.full(n_rows, np.nan)
+            else:
+                values, missing, non_numeric = _to_float(data[feature])
+                codes[missing] |= MISSING
+                codes[non_numeric] |= NON_NUMERIC
+                present = ~(missing | non_numeric)
+                if kind == "categorical":
+                    codes[present & ~np.isin(values, rule)] |= INVALID_OPTION
+                else:
+                    low, high = rule
+                    # NaN 比较结果为 False，缺失值不会被重复标记
+                    codes[values < low] |= BELOW_MIN
+                    codes[values > high] |= ABOVE_MAX
+                    if policy == "clip":
+                        values = np.clip(values, low, high)
+            errors[feature] = codes
+            clean[feature] = values
+            blocking = codes & CLIP_BLOCKING if policy == "clip" else codes
+            reject |= blocking != 0
+
+        clean = pd.DataFrame(clean, columns=self.feature_order, index=data.index)
+        return ValidationResult(errors, ~reject, clean, policy)
+
+
+def _synthetic_batch(n_rows, rng, error_rate=0.01, ranges=None):
+    # 生成带少量错误（越界、非数值、缺失、无效选项）的批量输入，用于基准测试
+    ranges = feature_ranges if ranges is None else ranges
+    columns = {}
+    for feature, properties in ranges.items():
+        if properties["type"] == "categorical":
+            values = rng.choice(properties["options"], size=n_rows).astype(np.float64)
+            values[rng.random(n_rows) < error_rate] = max(properties["options"]) + 1
+        else:
+            span = properties["max"] - properties["min"]
+            values = rng.uniform(properties["min"] - 0.05 * span, properties["max"] + 0.05 * span, size=n_rows)
+        values[rng.random(n_rows) < error_rate] = np.nan
+        columns[feature] = values
+    data = pd.DataFrame(columns)
+    # 文件输入常见情形：一列读成字符串，其中混有无法解析的文本
+    text_feature = next(f for f, p in ranges.items() if p["type"] == "numerical")
+    text = data[text_feature].round(1).astype(str).to_numpy(dtype=object)
+    text[data[text_feature].isna().to_numpy()] = None
+    text[rng.random(n_rows) < error_rate] = "未测"
+    data[text_feature] = text
+    return data
+
+
+def benchmark(n_rows=1_000_000, repeat=3, seed=0):
+    rng = np.random.default_rng(seed)
+    data = _synthetic_batch(n_rows, rng)
+    validator = InputValidator()
+    results = {}
+    for policy in POLICIES:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = validator.validate(data, policy=policy)
+            timings.append(time.perf_counter() - start)
+        results[policy] = {"seconds": min(timings), "valid_rows": result.n_valid}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按 feature_ranges 校验患者输入文件")
+    parser.add_argument("input", nargs="?", help="待校验的 CSV 文件")
+    parser.add_argument("--policy", default="reject", choices=POLICIES, help="越界数值的处理策略")
+    parser.add_argument("--out", help="输出通过校验的行（CSV）")
+    parser.add_argument("--benchmark", action="store_true", help="运行批量校验基准测试")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="基准测试的行数")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for policy, r in benchmark(args.rows).items():
+            print(f"{policy}: {args.rows} 行耗时 {r['seconds']:.3f} 秒 "
+                  f"({args.rows / r['seconds'] / 1e6:.2f} 百万行/秒)，通过 {r['valid_rows']} 行")
+        return
+    if not args.input:
+        parser.error("请提供待校验的 CSV 文件或使用 --benchmark")
+
+    result = InputValidator().validate(pd.read_csv(args.input), policy=args.policy)
+    print(f"共 {result.n_rows} 行，通过 {result.n_valid} 行")
+    print(result.summary().to_string())
+    if args.out:
+        result.accepted().to_csv(args.out, index=False)
+
+
+if __name__ == "__main__":
+    main()
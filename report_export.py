@@ -0,0 +1,599 @@
+# 患者报告渲染与批量导出。
+#
+# 报告内容与界面一致：风险仪表盘、风险类别、生存/死亡概率、SHAP 特征影响图和免责声明。
+# 批量导出时在进程池中渲染，每个工作进程只加载一次字体并复用图表模板，
+# 生成的 PNG 逐个写入 ZIP 文件，不在内存中保留全部报告。
+# 命令行用法：
+#     python report_export.py patients.csv --model rf1.pkl --out reports.zip --workers 4
+#     python report_export.py --benchmark --reports 500
+import argparse
+import io
+import multiprocessing
+import os
+import platform
+import re
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib as mpl
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image, ImageDraw, ImageFont
+
+# SHAP图画布尺寸（与界面显示一致）
+CANVAS_WIDTH = 800
+CANVAS_HEIGHT = 500
+GRAPH_PASTE_X = 250  # 左侧留出足够空间放置特征标签
+GRAPH_PASTE_Y = 50   # 顶部留出空间放置标题
+
+# 报告页面布局
+REPORT_WIDTH = 800
+GAUGE_TOP = 80
+GAUGE_HEIGHT = 230
+SHAP_TOP = 430
+REPORT_HEIGHT = SHAP_TOP + CANVAS_HEIGHT + 130
+
+DISCLAIMER = "免责声明：本预测工具仅供临床医生参考，不能替代专业医疗判断。预测结果应结合患者的完整临床情况进行综合评估。"
+CHART_EXPLANATION = "图表解释: 红色条表示该特征增加死亡风险，蓝色条表示该特征降低死亡风险。数值表示对预测结果的贡献大小。"
+
+
+# 风险分层：死亡风险（百分比）高于阈值即属于该类别，按阈值从高到低排列
+RISK_BANDS = [(70, "高风险", "red"), (30, "中等风险", "orange")]
+LOW_RISK_BAND = ("低风险", "green")
+
+
+def risk_band(death_probability):
+    # 根据死亡风险（百分比）返回风险类别和显示颜色
+    for threshold, category, color in RISK_BANDS:
+        if death_probability > threshold:
+            return category, color
+    return LOW_RISK_BAND
+
+
+def risk_band_categories(death_probability):
+    # risk_band 的向量化版本，只返回风险类别数组（用于批量预测）
+    death_probability = np.asarray(death_probability, dtype=np.float64)
+    return np.select(
+        [death_probability > threshold for threshold, _, _ in RISK_BANDS],
+        [category for _, category, _ in RISK_BANDS],
+        default=LOW_RISK_BAND[0],
+    )
+
+
+def find_font_path():
+    # 查找可用的中文字体文件，找不到时尝试下载思源黑体
+    if platform.system() == 'Windows':
+        candidates = [
+            "C:\\Windows\\Fonts\\msyh.ttc",    # 微软雅黑
+            "C:\\Windows\\Fonts\\simhei.ttf",  # 黑体
+            "C:\\Windows\\Fonts\\simsun.ttc"   # 宋体
+        ]
+    else:
+        candidates = [
+            "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+            "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+            "/System/Library/Fonts/STHeiti Light.ttc"
+        ]
+    for path in candidates:
+        if os.path.exists(path):
+            return path
+
+    try:
+        # 从GitHub下载思源黑体
+        import urllib.request
+        font_url = "https://github.com/adobe-fonts/source-han-sans/raw/release/OTF/SimplifiedChinese/SourceHanSansSC-Regular.otf"
+        font_path = os.path.join(tempfile.mkdtemp(), "SourceHanSansSC-Regular.otf")
+        urllib.request.urlretrieve(font_url, font_path)
+        return font_path
+    except Exception:
+        # 使用系统默认
+        return "DejaVuSans.ttf"
+
+
+def load_report_fonts(font_path):
+    # 加载报告与SHAP图使用的全部字号，加载失败时抛出异常
+    return {
+        "large": ImageFont.truetype(font_path, 28),
+        "title": ImageFont.truetype(font_path, 20),
+        "feature": ImageFont.truetype(font_path, 15),
+        "value": ImageFont.truetype(font_path, 13),
+        "small": ImageFont.truetype(font_path, 12),
+    }
+
+
+def default_report_fonts():
+    # 使用PIL默认字体
+    default = ImageFont.load_default()
+    return {name: default for name in ("large", "title", "feature", "value", "small")}
+
+
+def top_feature_contributions(feature_names, shap_vals, k=7):
+    # 按SHAP值绝对值排序并选择前k个特征
+    shap_vals = np.asarray(shap_vals, dtype=np.float64)
+    order = np.argsort(-np.abs(shap_vals), kind="stable")[:k]
+    return [feature_names[i] for i in order], shap_vals[order]
+
+
+def format_feature_labels(features, feature_values):
+    # 准备特征标签和值，例如 "2期 = TNM分期"
+    labels = []
+    for feature in features:
+        if feature in feature_values:
+            value = feature_values[feature]
+            # 处理分类特征
+            if feature == "TNM分期":
+                value_display = f"{int(value)}期"
+            elif feature == "淋巴血管侵犯":
+                value_display = "是" if value == 1 else "否"
+            else:
+                value_display = f"{value}"
+            labels.append(f"{value_display} = {feature}")
+        else:
+            labels.append(feature)
+    return labels
+
+
+def format_base_value(expected_value):
+    # 计算基准值并格式化为小数点后3位
+    base_value = expected_value
+    if isinstance(base_value, (np.ndarray, list)) and len(base_value) > 1:
+        base_value = base_value[1]  # 假设是二分类，取第二个类别
+    if isinstance(base_value, np.ndarray) and base_value.size == 1:
+        base_value = float(base_value.item())
+    try:
+        return float(f"{base_value:.3f}")
+    except Exception:
+        return 0.5  # 默认值
+
+
+def positive_class_shap_values(values):
+    # 多分类输出 (样本, 特征, 类别) 时选择第二个类别(通常是正类/死亡类)
+    values = np.asarray(values)
+    if values.ndim > 2:
+        return values[..., 1]
+    return values
+
+
+class ShapChartTemplate:
+    # 复用的条形图模板：坐标轴、网格和条形只创建一次，每次渲染只更新条形长度和颜色
+
+    def __init__(self, n_bars):
+        self.figure = Figure(figsize=(8, 4), dpi=100, facecolor='white')
+        self.canvas = FigureCanvasAgg(self.figure)
+        ax = self.figure.add_subplot()
+        y_pos = np.arange(n_bars)
+        # 绘制水平条形图，使用序号代替中文标签
+        self.bars = ax.barh(y_pos, np.zeros(n_bars), alpha=0.8)
+        ax.set_yticks(y_pos, [str(i) for i in range(n_bars)])
+        # 第一个（最重要的）特征在最上方，与左侧文字标签的顺序一致
+        ax.invert_yaxis()
+        # 添加垂直中轴线
+        ax.axvline(x=0, color='gray', linestyle='-', alpha=0.3)
+        ax.set_xlabel("SHAP值", fontsize=10)
+        # 美化图表
+        ax.grid(axis='x', linestyle='--', alpha=0.3)
+        ax.set_frame_on(False)  # 移除边框
+        ax.set_xlim(-1, 1)
+        self.figure.tight_layout()
+        self.ax = ax
+
+    def render(self, shap_vals, max_val):
+        for bar, value in zip(self.bars, shap_vals):
+            bar.set_width(value)
+            bar.set_color('#ff4d4d' if value > 0 else '#2196F3')
+        self.ax.set_xlim(-max_val, max_val)
+        self.canvas.draw()
+        # 直接读取渲染缓冲区，省去PNG编码和解码
+        return Image.fromarray(np.asarray(self.canvas.buffer_rgba())).convert('RGB')
+
+
+def render_shap_chart(feature_labels, shap_vals, base_value, fonts, template=None):
+    # 绘制与界面一致的SHAP特征影响图，返回PIL图像
+    shap_vals = np.asarray(shap_vals, dtype=np.float64)
+    if template is None:
+        template = ShapChartTemplate(len(shap_vals))
+    max_val = float(np.max(np.abs(shap_vals))) * 1.2 or 1.0
+    img = template.render(shap_vals, max_val)
+
+    # 创建一个全新的白色画布，更大，以便有足够空间放置文本
+    canvas = Image.new('RGB', (CANVAS_WIDTH, CANVAS_HEIGHT), 'white')
+    # 将原始条形图粘贴到新画布中间部分
+    canvas.paste(img, (GRAPH_PASTE_X, GRAPH_PASTE_Y))
+    draw = ImageDraw.Draw(canvas)
+
+    # 添加标题
+    title_text = "特征对预测的影响"
+    title_width = draw.textlength(title_text, font=fonts["title"])
+    draw.text((CANVAS_WIDTH // 2 - title_width // 2, 15), title_text, fill="black", font=fonts["title"])
+
+    # 根据条形图在新画布中的位置计算条形图的Y坐标范围
+    graph_height = img.height * 0.7  # 条形图在原始图像中的高度比例
+    bar_area_top = GRAPH_PASTE_Y + img.height * 0.15  # 条形图在原始图像中的顶部位置
+    bar_area_bottom = bar_area_top + graph_height
+    bar_height = graph_height / len(feature_labels)
+
+    # 添加特征标签到左侧，确保与条形图对齐
+    for i, label in enumerate(feature_labels):
+        bar_center_y = bar_area_top + i * bar_height + bar_height / 2
+        label_width = draw.textlength(label, font=fonts["feature"])
+        draw.text((GRAPH_PASTE_X - label_width - 10, bar_center_y - 10), label, fill="black", font=fonts["feature"])
+
+    # 计算SHAP值的位置和显示
+    center_x = GRAPH_PASTE_X + img.width / 2  # 图表中心X坐标
+    graph_width = img.width * 0.7  # 估计条形图在原图中的宽度
+    for i, value in enumerate(shap_vals):
+        bar_center_y = bar_area_top + i * bar_height + bar_height / 2
+        if value > 0:
+            # 正值在条形图右侧
+            x_position = center_x + (value / max_val) * (graph_width / 2) + 5
+            draw.text((x_position, bar_center_y - 8), f"+{value:.2f}", fill="black", font=fonts["value"])
+        else:
+            # 负值在条形图左侧
+            x_position = center_x + (value / max_val) * (graph_width / 2) - 5
+            text = f"{value:.2f}"
+            text_width = draw.textlength(text, font=fonts["value"])
+            draw.text((x_position - text_width, bar_center_y - 8), text, fill="black", font=fonts["value"])
+
+    # 添加X轴标签
+    x_label = "SHAP值"
+    x_label_width = draw.textlength(x_label, font=fonts["feature"])
+    draw.text((center_x - x_label_width / 2, bar_area_bottom + 20), x_label, fill="black", font=fonts["feature"])
+
+    # 添加基准值文本
+    draw.text((20, CANVAS_HEIGHT - 30), f"基准值 f(x) = {base_value}", fill="black", font=fonts["small"])
+
+    # 添加图例
+    legend_y1 = CANVAS_HEIGHT - 60
+    legend_y2 = CANVAS_HEIGHT - 40
+    draw.rectangle([(CANVAS_WIDTH - 180, legend_y1), (CANVAS_WIDTH - 160, legend_y1 + 15)], fill="#ff4d4d")
+    draw.text((CANVAS_WIDTH - 155, legend_y1), "增加风险", fill="black", font=fonts["small"])
+    draw.rectangle([(CANVAS_WIDTH - 180, legend_y2), (CANVAS_WIDTH - 160, legend_y2 + 15)], fill="#2196F3")
+    draw.text((CANVAS_WIDTH - 155, legend_y2), "降低风险", fill="black", font=fonts["small"])
+    return canvas
+
+
+def _wrap_text(draw, text, font, max_width):
+    # 按像素宽度逐字换行（中文没有空格分词）
+    lines, line = [], ""
+    for char in text:
+        if line and draw.textlength(line + char, font=font) > max_width:
+            lines.append(line)
+            line = ""
+        line += char
+    if line:
+        lines.append(line)
+    return lines
+
+
+class ReportRenderer:
+    # 单个患者报告的渲染器；字体、SHAP图模板和报告底图在构造时准备一次，之后反复使用
+
+    def __init__(self, font_path=None, fonts=None):
+        if fonts is None:
+            try:
+                fonts = load_report_fonts(font_path or find_font_path())
+            except Exception:
+                fonts = default_report_fonts()
+        self.fonts = fonts
+        self.chart_templates = {}
+        self.gauge_box = (REPORT_WIDTH // 2 - 170, GAUGE_TOP + 20, REPORT_WIDTH // 2 + 170, GAUGE_TOP + 360)
+        self.page = self._build_page()
+
+    def _build_page(self):
+        # 报告中不随患者变化的部分：标题、仪表盘底色与刻度、小标题、说明和免责声明
+        page = Image.new('RGB', (REPORT_WIDTH, REPORT_HEIGHT), 'white')
+        draw = ImageDraw.Draw(page)
+        fonts = self.fonts
+
+        title = "胃癌术后三年生存预测报告"
+        draw.text((REPORT_WIDTH // 2 - draw.textlength(title, font=fonts["title"]) // 2, 15), title,
+                  fill="#1E3A8A", font=fonts["title"])
+        draw.line([(20, 70), (REPORT_WIDTH - 20, 70)], fill="#E5E7EB", width=2)
+
+        # 仪表盘底色：绿色 0-30、橙色 30-70、红色 70-100
+        for low, high, color in ((0, 30, "green"), (30, 70, "orange"), (70, 100, "red")):
+            draw.arc(self.gauge_box, 180 + 1.8 * low, 180 + 1.8 * high, fill=color, width=40)
+        draw.arc(self.gauge_box, 180, 360, fill="gray", width=1)
+        cx = (self.gauge_box[0] + self.gauge_box[2]) / 2
+        cy = (self.gauge_box[1] + self.gauge_box[3]) / 2
+        radius = (self.gauge_box[2] - self.gauge_box[0]) / 2
+        for tick in range(0, 101, 10):
+            angle = np.radians(180 + 1.8 * tick)
+            x, y = cx + (radius + 12) * np.cos(angle), cy + (radius + 12) * np.sin(angle)
+            text = str(tick)
+            draw.text((x - draw.textlength(text, font=fonts["small"]) / 2, y - 8), text, fill="black", font=fonts["small"])
+
+        draw.line([(20, SHAP_TOP - 35), (REPORT_WIDTH - 20, SHAP_TOP - 35)], fill="#E5E7EB", width=1)
+        draw.text((20, SHAP_TOP - 30), "预测结果解释", fill="#1E3A8A", font=fonts["feature"])
+
+        y = SHAP_TOP + CANVAS_HEIGHT + 10
+        for line in _wrap_text(draw, CHART_EXPLANATION, fonts["small"], REPORT_WIDTH - 40):
+            draw.text((20, y), line, fill="black", font=fonts["small"])
+            y += 18
+        draw.line([(20, y + 10), (REPORT_WIDTH - 20, y + 10)], fill="#E5E7EB", width=1)
+        y += 20
+        for line in _wrap_text(draw, DISCLAIMER, fonts["small"], REPORT_WIDTH - 40):
+            draw.text((20, y), line, fill="#6B7280", font=fonts["small"])
+            y += 18
+        return page
+
+    def _chart_template(self, n_bars):
+        if n_bars not in self.chart_templates:
+            self.chart_templates[n_bars] = ShapChartTemplate(n_bars)
+        return self.chart_templates[n_bars]
+
+    def render(self, record):
+        # record: patient_id, feature_values, death_probability (0-100), feature_names, shap_values, base_value
+        # （可选 filename，仅用于 ZIP 中的文件名）
+        page = self.page.copy()
+        draw = ImageDraw.Draw(page)
+        fonts = self.fonts
+        death_probability = float(record["death_probability"])
+        survival_probability = 100 - death_probability
+
+        patient_id = "未提供" if _missing_id(record["patient_id"]) else record["patient_id"]
+        patient_text = f"患者编号: {patient_id}"
+        draw.text((20, 45), patient_text, fill="#4B5563", font=fonts["small"])
+
+        # 仪表盘指示条和阈值线
+        inner_box = tuple(v + d for v, d in zip(self.gauge_box, (12, 12, -12, -12)))
+        draw.arc(inner_box, 180, 180 + 1.8 * death_probability, fill="darkblue", width=16)
+        cx = (self.gauge_box[0] + self.gauge_box[2]) / 2
+        cy = (self.gauge_box[1] + self.gauge_box[3]) / 2
+        radius = (self.gauge_box[2] - self.gauge_box[0]) / 2
+        angle = np.radians(180 + 1.8 * death_probability)
+        draw.line([(cx + (radius - 42) * np.cos(angle), cy + (radius - 42) * np.sin(angle)),
+                   (cx + radius * np.cos(angle), cy + radius * np.sin(angle))], fill="red", width=3)
+        value_text = f"{death_probability:.1f}"
+        draw.text((cx - draw.textlength(value_text, font=fonts["large"]) / 2, cy - 45), value_text,
+                  fill="black", font=fonts["large"])
+
+        # 风险类别
+        risk_category, risk_color = risk_band(death_probability)
+        draw.text((cx - draw.textlength(risk_category, font=fonts["title"]) / 2, GAUGE_TOP + GAUGE_HEIGHT - 20),
+                  risk_category, fill=risk_color, font=fonts["title"])
+
+        # 生存概率与死亡风险
+        y = GAUGE_TOP + GAUGE_HEIGHT + 30
+        for x_center, label, value, color in (
+            (REPORT_WIDTH * 0.25, "三年生存概率", survival_probability, "#10B981"),
+            (REPORT_WIDTH * 0.75, "三年死亡风险", death_probability, "#EF4444"),
+        ):
+            draw.text((x_center - draw.textlength(label, font=fonts["feature"]) / 2, y), label,
+                      fill="#1E3A8A", font=fonts["feature"])
+            text = f"{value:.1f}%"
+            draw.text((x_center - draw.textlength(text, font=fonts["title"]) / 2, y + 25), text,
+                      fill=color, font=fonts["title"])
+
+        # SHAP特征影响图
+        features, shap_vals = top_feature_contributions(record["feature_names"], record["shap_values"])
+        labels = format_feature_labels(features, record["feature_values"])
+        chart = render_shap_chart(labels, shap_vals, record["base_value"], fonts,
+                                  template=self._chart_template(len(shap_vals)))
+        page.paste(chart, (0, SHAP_TOP))
+        return page
+
+    def render_png(self, record):
+        buf = io.BytesIO()
+        self.render(record).save(buf, format='png', compress_level=3)
+        return buf.getvalue()
+
+
+def _missing_id(patient_id):
+    # None、NaN、pd.NA 或空字符串
+    if patient_id is None:
+        return True
+    try:
+        if patient_id != patient_id:
+            return True
+    except TypeError:
+        return True
+    return str(patient_id).strip() == ""
+
+
+def report_filename(patient_id, row=None):
+    # row 不为 None 时在文件名中加上行号，例如 report_3_P001.png；缺失的编号只保留行号
+    parts = [] if row is None else [str(row)]
+    if not _missing_id(patient_id):
+        parts.append(re.sub(r'[\\/:*?"<>|\s]', '_', str(patient_id)))
+    return "report_" + "_".join(parts) + ".png"
+
+
+def report_filenames(patient_ids, rows=None):
+    # 为一批患者生成报告文件名；编号缺失或文件名重复时，全部文件名加上行号以保证唯一
+    # rows: 每位患者的行号，默认为 1, 2, ...
+    patient_ids = list(patient_ids)
+    names = [report_filename(patient_id) for patient_id in patient_ids]
+    if len(set(names)) == len(names) and not any(_missing_id(patient_id) for patient_id in patient_ids):
+        return names, False
+    rows = range(1, len(patient_ids) + 1) if rows is None else list(rows)
+    return [report_filename(patient_id, row) for patient_id, row in zip(patient_ids, rows)], True
+
+
+# 工作进程内的渲染器，由 _init_worker 在进程启动时创建一次
+_worker_renderer = None
+
+
+def _init_worker(font_path, mpl_fonts):
+    global _worker_renderer
+    if mpl_fonts:
+        mpl.rcParams['font.sans-serif'] = mpl_fonts
+        mpl.rcParams['axes.unicode_minus'] = False
+    _worker_renderer = ReportRenderer(font_path)
+
+
+def _render_batch(records):
+    return [(r.get("filename") or report_filename(r["patient_id"]), _worker_renderer.render_png(r)) for r in records]
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_reports(records, font_path=None, workers=None, batch_size=16, max_in_flight=None, mpl_fonts=None):
+    # 按输入顺序逐个产出 (文件名, PNG字节)；workers=0 时在当前进程中串行渲染
+    font_path = font_path or find_font_path()
+    if workers == 0:
+        _init_worker(font_path, mpl_fonts)
+        for batch in _batched(records, batch_size):
+            yield from _render_batch(batch)
+        return
+
+    workers = workers or max(1, min(4, os.cpu_count() or 1))
+    # 限制同时提交的批次数，避免渲染结果在内存中堆积
+    max_in_flight = max_in_flight or workers * 2
+    # 使用 spawn 启动工作进程，避免从 Streamlit 的多线程进程中 fork
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(font_path, mpl_fonts)) as pool:
+        pending = deque()
+        for batch in _batched(records, batch_size):
+            pending.append(pool.submit(_render_batch, batch))
+            if len(pending) >= max_in_flight:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def export_reports_zip(records, output, total=None, progress=None, **render_options):
+    # 将报告流式写入 ZIP（output 为文件路径或可写文件对象），返回写入的报告数
+    if total is None and hasattr(records, "__len__"):
+        total = len(records)
+    count = 0
+    # PNG 已经压缩，ZIP 中直接存储
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as zf:
+        for name, png in render_reports(records, **render_options):
+            zf.writestr(name, png)
+            count += 1
+            if progress is not None:
+                progress(count, total)
+    return count
+
+
+def compute_report_records(model, features_df, patient_ids=None, explainer=None, chunk_size=1000, filenames=None):
+    # 分块批量计算预测概率和SHAP值，逐个产出报告记录
+    # filenames: 每位患者的报告文件名，默认由 report_filenames(patient_ids) 生成
+    if explainer is None:
+        import shap
+        explainer = shap.Explainer(model)
+    base_value = format_base_value(explainer.expected_value)
+    feature_names = list(features_df.columns)
+    if patient_ids is None:
+        patient_ids = range(1, len(features_df) + 1)
+    patient_ids = list(patient_ids)
+    if len(patient_ids) != len(features_df):
+        raise ValueError(f"患者编号数量 ({len(patient_ids)}) 与数据行数 ({len(features_df)}) 不一致")
+    if filenames is None:
+        filenames, _ = report_filenames(patient_ids)
+    filenames = list(filenames)
+
+    for start in range(0, len(features_df), chunk_size):
+        chunk = features_df.iloc[start:start + chunk_size]
+        death_probability = model.predict_proba(chunk)[:, 1] * 100
+        shap_values = positive_class_shap_values(explainer(chunk).values)
+        for i, row in enumerate(chunk.itertuples(index=False)):
+            yield {
+                "patient_id": patient_ids[start + i],
+                "filename": filenames[start + i],
+                "feature_values": dict(zip(feature_names, row)),
+                "death_probability": float(death_probability[i]),
+                "feature_names": feature_names,
+                "shap_values": shap_values[i],
+                "base_value": base_value,
+            }
+
+
+def _synthetic_records(n_reports, seed=0):
+    # 基准测试用的随机报告记录（渲染耗时与模型无关）
+    from feature_config import feature_ranges
+    rng = np.random.default_rng(seed)
+    feature_names = list(feature_ranges.keys())
+    for i in range(n_reports):
+        feature_values = {}
+        for feature, properties in feature_ranges.items():
+            if properties["type"] == "categorical":
+                feature_values[feature] = int(rng.choice(properties["options"]))
+            else:
+                feature_values[feature] = round(float(rng.uniform(properties["min"], properties["max"])), 1)
+        yield {
+            "patient_id": i + 1,
+            "feature_values": feature_values,
+            "death_probability": float(rng.uniform(0, 100)),
+            "feature_names": feature_names,
+            "shap_values": rng.normal(0, 0.05, size=len(feature_names)),
+            "base_value": 0.35,
+        }
+
+
+def benchmark(n_reports=500, workers=None, font_path=None):
+    # 比较串行渲染与进程池渲染的吞吐量（报告/秒）
+    font_path = font_path or find_font_path()
+    results = {}
+    for label, n_workers in (("serial", 0), ("pool", workers)):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            start = time.perf_counter()
+            count = export_reports_zip(_synthetic_records(n_reports), os.path.join(tmp_dir, "reports.zip"),
+                                       font_path=font_path, workers=n_workers)
+            seconds = time.perf_counter() - start
+        results[label] = {"reports": count, "seconds": seconds, "reports_per_second": count / seconds}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量导出患者预测报告 (ZIP)")
+    parser.add_argument("input", nargs="?", help="患者数据 CSV 文件")
+    parser.add_argument("--model", default="rf1.pkl", help="模型文件路径")
+    parser.add_argument("--out", default="reports.zip", help="输出 ZIP 文件")
+    parser.add_argument("--id-column", help="作为患者编号的列名，默认使用行号")
+    parser.add_argument("--workers", type=int, help="工作进程数，0 表示在当前进程串行渲染")
+    parser.add_argument("--benchmark", action="store_true", help="运行报告渲染基准测试")
+    parser.add_argument("--reports", type=int, default=500, help="基准测试的报告数量")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for label, r in benchmark(args.reports, workers=args.workers).items():
+            print(f"{label}: {r['reports']} 份报告耗时 {r['seconds']:.1f} 秒，{r['reports_per_second']:.1f} 份/秒")
+        return
+    if not args.input:
+        parser.error("请提供患者数据 CSV 文件或使用 --benchmark")
+
+    import joblib
+    import pandas as pd
+    from input_validation import InputValidator
+
+    model = joblib.load(args.model)
+    data = pd.read_csv(args.input)
+    feature_order = list(model.feature_names_in_) if hasattr(model, "feature_names_in_") else None
+    validation = InputValidator(feature_order=feature_order).validate(data)
+    if validation.n_valid < validation.n_rows:
+        print(f"{validation.n_rows - validation.n_valid} 行未通过校验，已跳过")
+    features_df = validation.accepted()
+    patient_ids = data.loc[features_df.index, args.id_column] if args.id_column else features_df.index + 1
+    filenames, disambiguated = report_filenames(patient_ids, rows=features_df.index + 1)
+    if disambiguated:
+        print("患者编号存在重复或缺失，报告文件名已加上原文件行号")
+
+    def report(done, total):
+        print(f"\r已导出 {done}/{total}", end="", flush=True)
+
+    start = time.perf_counter()
+    count = export_reports_zip(compute_report_records(model, features_df, patient_ids, filenames=filenames), args.out,
+                               total=len(features_df), progress=report, workers=args.workers)
+    seconds = time.perf_counter() - start
+    print()
+    print(f"已导出 {count} 份报告到 {args.out}，耗时 {seconds:.1f} 秒（{count / max(seconds, 1e-9):.1f} 份/秒）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# 风险查找表：在量化的输入网格上离线预计算模型风险，供界面在滑块移动时即时显示近似风险。
+#
+# 离线构建（分块向量化调用模型，结果写入内存映射的 .npy 文件，并在 .json 中记录网格与误差报告）：
+#     python risk_grid.py --model rf1.pkl --out risk_grid
+# 界面中仅用于近似显示，点击"开始预测"时仍调用模型得到精确结果。
+import argparse
+import hashlib
+import json
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from feature_config import feature_ranges
+from report_export import risk_band_categories
+
+# 数值特征的量化网格点 - 在临床常见区间加密，两端保留滑块的最小/最大值
+# 分类特征（TNM分期、淋巴血管侵犯）直接使用 feature_ranges 中的全部选项
+grid_points = {
+    "术中出血量": [0, 25, 50, 100, 150, 200, 300, 400, 600, 800],
+    "CEA": [0, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 50, 75, 100, 150],
+    "白蛋白": [1, 20, 25, 28, 30, 32, 34, 36, 38, 40, 42, 45, 50, 60, 80],
+    "年龄": [25, 30, 35, 40, 45, 50, 55, 60, 65, 70, 75, 80, 85, 90],
+    "术中肿瘤最大直径": [0.2, 0.5, 1, 1.5, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20],
+}
+
+# uint8 存储时概率按 1/255 量化，float16 约有 3 位有效数字
+SUPPORTED_DTYPES = ("uint8", "float16")
+
+
+def model_fingerprint(model_path):
+    # 模型文件的 sha256，用于识别离线产物（查找表、代理解释模型）是否由当前模型生成
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def grid_axes(feature_order, ranges=None):
+    # 按模型特征顺序返回每个维度的网格点
+    ranges = feature_ranges if ranges is None else ranges
+    axes = []
+    for feature in feature_order:
+        properties = ranges[feature]
+        if properties["type"] == "categorical":
+            points = sorted(properties["options"])
+        else:
+            points = grid_points.get(feature)
+            if points is None:
+                # 未单独配置的数值特征使用等距网格
+                points = np.linspace(properties["min"], properties["max"], 11)
+        axes.append(np.asarray(points, dtype=np.float64))
+    return axes
+
+
+def _encode(proba, dtype):
+    if dtype == "uint8":
+        return np.rint(np.clip(proba, 0.0, 1.0) * 255).astype(np.uint8)
+    return proba.astype(np.float16)
+
+
+def _decode(values, dtype):
+    if dtype == "uint8":
+        return values.astype(np.float32) / 255.0
+    return values.astype(np.float32)
+
+
+class RiskGrid:
+    # 已构建的风险查找表，values 通常是只读的内存映射数组
+
+    def __init__(self, values, axes, feature_order, feature_types, dtype, meta=None):
+        self.values = values
+        self.axes = axes
+        self.feature_order = list(feature_order)
+        self.feature_types = list(feature_types)
+        self.dtype = dtype
+        self.meta = meta or {}
+
+    @classmethod
+    def load(cls, prefix):
+        with open(f"{prefix}.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        values = np.load(f"{prefix}.npy", mmap_mode="r")
+        axes = [np.asarray(a, dtype=np.float64) for a in meta["axes"]]
+        if tuple(values.shape) != tuple(len(a) for a in axes):
+            raise ValueError(f"查找表形状 {values.shape} 与网格定义不一致")
+        return cls(values, axes, meta["feature_order"], meta["feature_types"], meta["dtype"], meta)
+
+    @property
+    def model_sha256(self):
+        return self.meta.get("model_sha256")
+
+    @property
+    def error_report(self):
+        return self.meta.get("error_report")
+
+    def lookup(self, X):
+        # X: (n, 特征数) 数组或 DataFrame，按 feature_order 排列；返回近似死亡概率 (0-1)
+        if isinstance(X, pd.DataFrame):
+            X = X[self.feature_order].to_numpy(dtype=np.float64)
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+
+        # 分类维度取最近的选项；数值维度做多线性插值
+        base_index = []
+        fractions = []
+        for j, axis in enumerate(self.axes):
+            x = np.clip(X[:, j], axis[0], axis[-1])
+            if self.feature_types[j] == "categorical" or len(axis) == 1:
+                idx = np.clip(np.searchsorted(axis, x), 0, len(axis) - 1)
+                left = np.clip(idx - 1, 0, len(axis) - 1)
+                idx = np.where(np.abs(axis[left] - x) < np.abs(axis[idx] - x), left, idx)
+                base_index.append(idx)
+                fractions.append(None)
+            else:
+                idx = np.clip(np.searchsorted(axis, x, side="right") - 1, 0, len(axis) - 2)
+                t = (x - axis[idx]) / (axis[idx + 1] - axis[idx])
+                base_index.append(idx)
+                fractions.append(t)
+
+        interp_dims = [j for j, t in enumerate(fractions) if t is not None]
+        result = np.zeros(X.shape[0], dtype=np.float64)
+        for corner in range(1 << len(interp_dims)):
+            index = list(base_index)
+            weight = np.ones(X.shape[0], dtype=np.float64)
+            for bit, j in enumerate(interp_dims):
+                if corner >> bit & 1:
+                    index[j] = base_index[j] + 1
+                    weight *= fractions[j]
+                else:
+                    weight *= 1.0 - fractions[j]
+            result += weight * _decode(self.values[tuple(index)], self.dtype)
+        return result
+
+    def lookup_one(self, feature_values):
+        # feature_values: {特征名: 值}，返回单个患者的近似死亡概率 (0-1)
+        row = [[feature_values[feature] for feature in self.feature_order]]
+        return float(self.lookup(row)[0])
+
+
+def sample_inputs(feature_order, n_samples, rng, ranges=None):
+    # 在 feature_ranges 的取值范围内均匀采样（数值特征为连续值，与滑块步长一致）
+    ranges = feature_ranges if ranges is None else ranges
+    columns = {}
+    for feature in feature_order:
+        properties = ranges[feature]
+        if properties["type"] == "categorical":
+            columns[feature] = rng.choice(properties["options"], size=n_samples)
+        else:
+            values = rng.uniform(properties["min"], properties["max"], size=n_samples)
+            # 与界面滑块的 0.1 步长一致
+            columns[feature] = np.round(values, 1)
+    return pd.DataFrame(columns, columns=feature_order)
+
+
+def evaluate_grid(model, grid, n_samples=20000, seed=0):
+    # 随机采样输入，比较查找表近似值与模型精确值，误差以百分点表示
+    rng = np.random.default_rng(seed)
+    samples = sample_inputs(grid.feature_order, n_samples, rng)
+    exact = model.predict_proba(samples)[:, 1]
+    approx = grid.lookup(samples)
+    abs_error = np.abs(approx - exact) * 100
+    return {
+        "n_samples": int(n_samples),
+        "mae": float(abs_error.mean()),
+        "p95": float(np.percentile(abs_error, 95)),
+        "max": float(abs_error.max()),
+        # 近似值与精确值落在不同风险类别的比例
+        "band_mismatch_rate": float(np.mean(risk_band_categories(approx * 100) != risk_band_categories(exact * 100))),
+    }
+
+
+def build_risk_grid(model, out_prefix, feature_order=None, dtype="uint8", chunk_size=200_000,
+                    n_error_samples=20000, progress=None, model_path=None):
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"不支持的存储类型: {dtype}，可选: {SUPPORTED_DTYPES}")
+    if feature_order is None:
+        if hasattr(model, "feature_names_in_"):
+            feature_order = list(model.feature_names_in_)
+        else:
+            feature_order = list(feature_ranges.keys())
+
+    axes = grid_axes(feature_order)
+    feature_types = [feature_ranges[feature]["type"] for feature in feature_order]
+    shape = tuple(len(axis) for axis in axes)
+    total = int(np.prod(shape))
+
+    values = np.lib.format.open_memmap(f"{out_prefix}.npy", mode="w+", dtype=dtype, shape=shape)
+    flat = values.reshape(-1)
+    start_time = time.perf_counter()
+    for start in range(0, total, chunk_size):
+        stop = min(start + chunk_size, total)
+        coords = np.unravel_index(np.arange(start, stop), shape)
+        chunk = pd.DataFrame(
+            np.column_stack([axis[c] for axis, c in zip(axes, coords)]),
+            columns=feature_order,
+        )
+        flat[start:stop] = _encode(model.predict_proba(chunk)[:, 1], dtype)
+        if progress is not None:
+            progress(stop, total)
+    values.flush()
+    build_seconds = time.perf_counter() - start_time
+
+    meta = {
+        "feature_order": feature_order,
+        "feature_types": feature_types,
+        "axes": [axis.tolist() for axis in axes],
+        "dtype": dtype,
+        "shape": list(shape),
+        "build_seconds": build_seconds,
+        "model_sha256": model_fingerprint(model_path) if model_path else None,
+    }
+    grid = RiskGrid(np.load(f"{out_prefix}.npy", mmap_mode="r"), axes, feature_order, feature_types, dtype, meta)
+    if n_error_samples:
+        meta["error_report"] = evaluate_grid(model, grid, n_samples=n_error_samples)
+    with open(f"{out_prefix}.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线构建风险查找表")
+    parser.add_argument("--model", default="rf1.pkl", help="模型文件路径")
+    parser.add_argument("--out", default="risk_grid", help="输出文件前缀（生成 .npy 与 .json）")
+    parser.add_argument("--dtype", default="uint8", choices=SUPPORTED_DTYPES, help="概率存储类型")
+    parser.add_argument("--chunk-size", type=int, default=200_000, help="每次调用模型的网格点数")
+    parser.add_argument("--error-samples", type=int, default=20000, help="用于误差报告的随机样本数")
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+
+    def report(done, total):
+        print(f"\r已计算 {done}/{total} ({done / total:.0%})", end="", flush=True)
+
+    grid = build_risk_grid(model, args.out, dtype=args.dtype, chunk_size=args.chunk_size,
+                           n_error_samples=args.error_samples, progress=report, model_path=args.model)
+    print()
+    print(f"网格形状: {grid.values.shape}，共 {grid.values.size} 个点，{grid.values.nbytes / 1e6:.1f} MB，"
+          f"耗时 {grid.meta['build_seconds']:.1f} 秒")
+    if grid.error_report:
+        e = grid.error_report
+        print(f"近似误差（百分点）: 平均 {e['mae']:.2f}，P95 {e['p95']:.2f}，最大 {e['max']:.2f}；"
+              f"风险区间不一致比例 {e['band_mismatch_rate']:.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# 代理解释模型：离线用随机森林的精确 SHAP 值拟合每个特征的可加贡献表，
+# 在线时只需按特征查表插值即可得到近似 SHAP 值，用于快速生成前7特征影响图。
+#
+# 离线拟合（在 feature_ranges 内随机采样，或用 --data 指定真实患者数据）：
+#     python surrogate_explainer.py --model rf1.pkl --out surrogate_explainer.pkl
+# 拟合时在留出样本上与精确 SHAP 比较得到保真度；在线时用可加性残差估计单个输入的保真度，
+# 低于阈值时界面自动改用精确 SHAP。
+#
+# 局限：单个输入的保真度只检查可加性（基准值 + ΣSHAP 是否等于模型概率），
+# 总和正确但在各特征之间分配错误的近似值同样会得到高保真度。各特征贡献是否准确只能由
+# 拟合时留出样本上的 R²、前3特征一致率，以及达到阈值的输入上的 r2_fast_path 反映。
+import argparse
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from feature_config import feature_ranges
+from risk_grid import grid_axes, model_fingerprint, sample_inputs
+from report_export import positive_class_shap_values
+
+
+def _hat_basis(x, knots):
+    # 分段线性插值的基函数矩阵 (样本数, 节点数)，每行最多两个非零权重
+    x = np.clip(x, knots[0], knots[-1])
+    basis = np.zeros((len(x), len(knots)))
+    if len(knots) == 1:
+        basis[:, 0] = 1.0
+        return basis
+    idx = np.clip(np.searchsorted(knots, x, side="right") - 1, 0, len(knots) - 2)
+    t = (x - knots[idx]) / (knots[idx + 1] - knots[idx])
+    rows = np.arange(len(x))
+    basis[rows, idx] = 1.0 - t
+    basis[rows, idx + 1] += t
+    return basis
+
+
+def _top_k_agreement(exact, approx, k=3):
+    # 每个样本中绝对值最大的前k个特征集合是否一致的比例
+    k = min(k, exact.shape[1])
+    top_exact = np.sort(np.argsort(-np.abs(exact), axis=1)[:, :k], axis=1)
+    top_approx = np.sort(np.argsort(-np.abs(approx), axis=1)[:, :k], axis=1)
+    return float(np.mean(np.all(top_exact == top_approx, axis=1)))
+
+
+def _r2(exact, approx):
+    total = np.sum((exact - exact.mean()) ** 2)
+    return float(1 - np.sum((exact - approx) ** 2) / total) if total > 0 else 1.0
+
+
+class SurrogateExplainer:
+    # 每个特征一张贡献表：knots[j] 为网格节点，tables[j] 为节点处的 SHAP 贡献
+
+    def __init__(self, feature_order, knots, tables, base_value, threshold=0.8, fidelity=None, model_sha256=None):
+        self.feature_order = list(feature_order)
+        self.knots = [np.asarray(k, dtype=np.float64) for k in knots]
+        self.tables = [np.asarray(t, dtype=np.float64) for t in tables]
+        self.base_value = float(base_value)
+        self.threshold = float(threshold)
+        self.fidelity = fidelity or {}
+        # 拟合所用模型文件的 sha256，模型更换后贡献表与保真度均失效
+        self.model_sha256 = model_sha256
+
+    @classmethod
+    def fit(cls, model, X, explainer=None, holdout_fraction=0.2, threshold=0.8, ridge=1e-6, chunk_size=2000,
+            seed=0, progress=None, model_path=None):
+        # X: 用于拟合的输入样本 (DataFrame)，列顺序与模型一致
+        if explainer is None:
+            import shap
+            explainer = shap.Explainer(model)
+        feature_order = list(X.columns)
+        expected_value = np.asarray(explainer.expected_value, dtype=np.float64).reshape(-1)
+        base_value = expected_value[1] if expected_value.size > 1 else expected_value[0]
+
+        # 分块计算精确 SHAP 值与模型概率
+        shap_chunks = []
+        for start in range(0, len(X), chunk_size):
+            shap_chunks.append(positive_class_shap_values(explainer(X.iloc[start:start + chunk_size]).values))
+            if progress is not None:
+                progress(min(start + chunk_size, len(X)), len(X))
+        exact = np.concatenate(shap_chunks)
+        probability = model.predict_proba(X)[:, 1]
+
+        rng = np.random.default_rng(seed)
+        holdout = rng.random(len(X)) < holdout_fraction
+        train = ~holdout
+        values = X.to_numpy(dtype=np.float64)
+
+        # 每个特征在网格节点上做分段线性最小二乘拟合（小的岭项防止节点上无样本时矩阵奇异）
+        knots = grid_axes(feature_order)
+        tables = []
+        for j, knot in enumerate(knots):
+            basis = _hat_basis(values[train, j], knot)
+            gram = basis.T @ basis + ridge * max(train.sum(), 1) * np.eye(len(knot))
+            tables.append(np.linalg.solve(gram, basis.T @ exact[train, j]))
+
+        surrogate = cls(feature_order, knots, tables, base_value, threshold,
+                        model_sha256=model_fingerprint(model_path) if model_path else None)
+        surrogate.fidelity = surrogate.evaluate(values[holdout], exact[holdout], probability[holdout])
+        surrogate.fidelity["n_train"] = int(train.sum())
+        return surrogate
+
+    def explain(self, X):
+        # X: (n, 特征数) 数组或 DataFrame，返回近似 SHAP 值 (n, 特征数)
+        if isinstance(X, pd.DataFrame):
+            X = X[self.feature_order].to_numpy(dtype=np.float64)
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        return np.column_stack([
+            np.interp(X[:, j], knot, table) for j, (knot, table) in enumerate(zip(self.knots, self.tables))
+        ])
+
+    def local_fidelity(self, shap_vals, probability):
+        # 精确 SHAP 满足 基准值 + ΣSHAP = 模型概率；用代理结果违反该等式的程度估计单个输入的保真度 (0-1)
+        shap_vals = np.atleast_2d(shap_vals)
+        residual = np.abs(self.base_value + shap_vals.sum(axis=1) - np.asarray(probability, dtype=np.float64))
+        magnitude = np.abs(shap_vals).sum(axis=1)
+        return 1.0 - residual / np.maximum(magnitude + residual, 1e-9)
+
+    def explain_one(self, feature_values, probability):
+        # feature_values: {特征名: 值}；probability: 模型给出的死亡概率 (0-1)
+        # 返回按 feature_order 排列的近似 SHAP 值和该输入的保真度
+        row = [[feature_values[feature] for feature in self.feature_order]]
+        shap_vals = self.explain(row)
+        return shap_vals[0], float(self.local_fidelity(shap_vals, probability)[0])
+
+    def evaluate(self, X, exact, probability):
+        # 在留出样本上与精确 SHAP 比较
+        approx = self.explain(X)
+        local = self.local_fidelity(approx, probability)
+        accepted = local >= self.threshold
+        significant = np.abs(exact) > 1e-3
+        return {
+            "n_holdout": int(len(exact)),
+            "r2": _r2(exact, approx),
+            "mae": float(np.mean(np.abs(exact - approx))),
+            "sign_agreement": float(np.mean(np.sign(exact[significant]) == np.sign(approx[significant])))
+            if significant.any() else 1.0,
+            "top3_agreement": _top_k_agreement(exact, approx),
+            # 按阈值筛选后实际使用代理解释的比例，以及这些输入上的保真度
+            "fast_path_rate": float(accepted.mean()) if len(accepted) else 0.0,
+            "r2_fast_path": _r2(exact[accepted], approx[accepted]) if accepted.any() else None,
+        }
+
+    def save(self, path):
+        joblib.dump({
+            "feature_order": self.feature_order,
+            "knots": self.knots,
+            "tables": self.tables,
+            "base_value": self.base_value,
+            "threshold": self.threshold,
+            "fidelity": self.fidelity,
+            "model_sha256": self.model_sha256,
+        }, path)
+
+    @classmethod
+    def load(cls, path):
+        return cls(**joblib.load(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线拟合代理解释模型")
+    parser.add_argument("--model", default="rf1.pkl", help="模型文件路径")
+    parser.add_argument("--out", default="surrogate_explainer.pkl", help="输出文件")
+    parser.add_argument("--data", help="用于拟合的患者数据 CSV，默认在 feature_ranges 内随机采样")
+    parser.add_argument("--samples", type=int, default=5000, help="随机采样的样本数")
+    parser.add_argument("--threshold", type=float, default=0.8, help="单个输入的保真度阈值，低于该值时使用精确 SHAP")
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    feature_order = list(model.feature_names_in_) if hasattr(model, "feature_names_in_") else list(feature_ranges.keys())
+    if args.data:
+        from input_validation import InputValidator
+        X = InputValidator(feature_order=feature_order).validate(pd.read_csv(args.data)).accepted()
+    else:
+        # 采样与 fit 中留出集合的划分 (seed=0) 使用不同的随机种子，否则两者的随机序列相同，
+        # 留出集合恰好是第一个特征取值最小的一段，这些节点在训练集中没有样本
+        X = sample_inputs(feature_order, args.samples, np.random.default_rng(1))
+
+    def report(done, total):
+        print(f"\r精确 SHAP {done}/{total}", end="", flush=True)
+
+    start = time.perf_counter()
+    surrogate = SurrogateExplainer.fit(model, X, threshold=args.threshold, progress=report, model_path=args.model)
+    print()
+    surrogate.save(args.out)
+
+    # 比较单个输入的解释耗时
+    row = X.iloc[[0]]
+    start_fast = time.perf_counter()
+    for _ in range(1000):
+        surrogate.explain(row.to_numpy(dtype=np.float64))
+    fast_us = (time.perf_counter() - start_fast) / 1000 * 1e6
+
+    f = surrogate.fidelity
+    print(f"拟合耗时 {time.perf_counter() - start:.1f} 秒，已保存到 {args.out}")
+    print(f"留出样本 {f['n_holdout']} 个: R² {f['r2']:.3f}，平均绝对误差 {f['mae']:.4f}，"
+          f"符号一致 {f['sign_agreement']:.1%}，前3特征一致 {f['top3_agreement']:.1%}")
+    r2_fast = f"{f['r2_fast_path']:.3f}" if f["r2_fast_path"] is not None else "-"
+    print(f"阈值 {surrogate.threshold}: 快速路径比例 {f['fast_path_rate']:.1%}，其中 R² {r2_fast}；"
+          f"单次代理解释约 {fast_us:.0f} 微秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import json
+import os
+import tracemalloc
+from types import SimpleNamespace
+
+from diagnostics import _REPO_DIR, MemoryDiagnostics, _aggregate, _site
+
+
+def frame(filename, lineno):
+    return SimpleNamespace(filename=filename, lineno=lineno)
+
+
+def stat(frames, size_diff, count_diff=1):
+    # 与 tracemalloc.StatisticDiff 相同的属性；frames 按从旧到新排列
+    return SimpleNamespace(traceback=frames, size_diff=size_diff, size=size_diff, count_diff=count_diff)
+
+
+APP = os.path.join(_REPO_DIR, "APP4.py")
+REPORT = os.path.join(_REPO_DIR, "report_export.py")
+LIBRARY = "/usr/lib/python3/site-packages/numpy/core/numeric.py"
+
+
+def test_stage_is_noop_when_disabled():
+    diagnostics = MemoryDiagnostics()
+    assert not diagnostics.enabled
+    was_tracing = tracemalloc.is_tracing()
+    with diagnostics.stage("模型预测"):
+        data = [0] * 1000
+    assert len(data) == 1000
+    assert diagnostics.stage_stats == {}
+    assert tracemalloc.is_tracing() == was_tracing
+    assert diagnostics.record_live_objects() is None
+    assert diagnostics.top_growth_sites() == []
+
+
+def test_site_picks_nearest_repo_frame():
+    frames = [frame(APP, 10), frame(REPORT, 20), frame("<frozen abc>", 1), frame(LIBRARY, 30)]
+    site, caller = _site(stat(frames, 100))
+    assert site == f"{LIBRARY}:30"
+    assert caller == "report_export.py:20"
+
+
+def test_site_without_repo_frame_has_no_caller():
+    site, caller = _site(stat([frame(LIBRARY, 5)], 100))
+    assert site == f"{LIBRARY}:5"
+    assert caller is None
+
+
+def test_aggregate_merges_same_caller_and_site():
+    diff = [
+        # 两条调用栈只在仓库外的中间帧不同，合并为同一项
+        stat([frame(APP, 10), frame("/lib/a.py", 1), frame(LIBRARY, 30)], 100, 2),
+        stat([frame(APP, 10), frame("/lib/b.py", 2), frame(LIBRARY, 30)], 50, 1),
+        stat([frame(APP, 11), frame(LIBRARY, 30)], 120, 1),
+        stat([frame(APP, 12), frame(LIBRARY, 31)], -10, -1),
+    ]
+    top = _aggregate(diff, top_n=2)
+    assert [(entry["caller"], entry["size_diff"], entry["count_diff"]) for entry in top] == [
+        ("APP4.py:10", 150, 3),
+        ("APP4.py:11", 120, 1),
+    ]
+    assert top[0]["site"] == f"{LIBRARY}:30"
+
+
+def test_stage_records_growth_when_enabled():
+    diagnostics = MemoryDiagnostics(frames=5)
+    was_tracing = tracemalloc.is_tracing()
+    diagnostics.start()
+    try:
+        with diagnostics.stage("分配"):
+            kept = [bytearray(1024) for _ in range(200)]
+    finally:
+        if not was_tracing:
+            diagnostics.stop()
+    stats = diagnostics.stage_stats["分配"]
+    assert stats["calls"] == 1
+    assert stats["total_growth"] >= 200 * 1024
+    # 分配发生在本测试文件中，应被记为仓库内的调用位置
+    test_file = os.path.join("tests", "test_diagnostics.py")
+    assert any(caller and caller.startswith(test_file + ":") for caller, _ in stats["sites"])
+    del kept
+
+
+def test_save_writes_valid_json(tmp_path):
+    diagnostics = MemoryDiagnostics()
+    path = diagnostics.save(directory=str(tmp_path / "diagnostics"))
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    assert set(report) >= {"time", "rss_mb", "stages", "live_objects", "object_history", "top_growth_sites"}
+
+    report = {"stages": {"模型预测": {"calls": 1, "total_growth": 10, "last_growth": 10, "top_sites": []}}}
+    path = diagnostics.save(directory=str(tmp_path), report=report)
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) == report
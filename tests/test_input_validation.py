@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from input_validation import (
+    ABOVE_MAX, BELOW_MIN, INVALID_OPTION, MISSING, NON_NUMERIC, InputValidator,
+)
+
+RANGES = {
+    "CEA": {"type": "numerical", "min": 0, "max": 150.0},
+    "TNM分期": {"type": "categorical", "options": [1, 2, 3, 4]},
+}
+
+
+def validate(data, policy="reject"):
+    return InputValidator(RANGES).validate(pd.DataFrame(data), policy=policy)
+
+
+def test_valid_rows_pass_unchanged():
+    result = validate({"CEA": [0, 8.68, 150], "TNM分期": [1, 2, 4]})
+    assert result.row_valid.tolist() == [True, True, True]
+    assert not result.error_mask().any()
+    np.testing.assert_allclose(result.clean["CEA"], [0, 8.68, 150])
+
+
+def test_error_codes_per_field():
+    result = validate({
+        "CEA": [np.nan, "未测", "-1", "200", " 12 ", ""],
+        "TNM分期": [2, 5, 2.5, "II", None, 3],
+    })
+    assert result.errors["CEA"].tolist() == [MISSING, NON_NUMERIC, BELOW_MIN, ABOVE_MAX, 0, MISSING]
+    assert result.errors["TNM分期"].tolist() == [0, INVALID_OPTION, INVALID_OPTION, NON_NUMERIC, MISSING, 0]
+    assert not result.row_valid.any()
+
+
+def test_missing_column_marks_every_row():
+    result = validate({"CEA": [1.0, 2.0]})
+    assert result.errors["TNM分期"].tolist() == [MISSING, MISSING]
+    assert result.n_valid == 0
+
+
+def test_reject_policy_rejects_out_of_range_rows():
+    result = validate({"CEA": [-5.0, 10.0, 500.0], "TNM分期": [1, 1, 1]}, policy="reject")
+    assert result.row_valid.tolist() == [False, True, False]
+    assert result.accepted().index.tolist() == [1]
+
+
+def test_clip_policy_keeps_and_clips_out_of_range_rows():
+    result = validate({"CEA": [-5.0, 10.0, 500.0, "未测"], "TNM分期": [1, 1, 1, 1]}, policy="clip")
+    assert result.row_valid.tolist() == [True, True, True, False]
+    np.testing.assert_allclose(result.accepted()["CEA"], [0.0, 10.0, 150.0])
+    # 截断的行仍保留错误码，便于逐行说明
+    assert result.errors["CEA"].tolist() == [BELOW_MIN, 0, ABOVE_MAX, NON_NUMERIC]
+    assert result.row_messages(2) == ["CEA: 高于最大值"]
+
+
+def test_clip_policy_still_rejects_invalid_option():
+    result = validate({"CEA": [10.0], "TNM分期": [7]}, policy="clip")
+    assert not result.row_valid[0]
+
+
+def test_single_patient_dict():
+    result = InputValidator(RANGES).validate({"CEA": 8.68, "TNM分期": 2})
+    assert result.n_rows == 1 and result.row_valid[0]
+
+
+def test_numeric_input_is_not_modified():
+    data = pd.DataFrame({"CEA": [np.inf, 10.0], "TNM分期": [1, 1]})
+    result = InputValidator(RANGES).validate(data)
+    assert result.errors["CEA"][0] == NON_NUMERIC
+    assert np.isinf(data["CEA"].iloc[0])
+
+
+def test_unknown_policy_raises():
+    with pytest.raises(ValueError):
+        validate({"CEA": [1.0], "TNM分期": [1]}, policy="drop")
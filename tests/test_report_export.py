@@ -0,0 +1,142 @@
+import io
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+
+from report_export import (
+    compute_report_records, export_reports_zip, render_reports, report_filename, report_filenames, risk_band,
+    risk_band_categories, top_feature_contributions,
+)
+
+FONT = "DejaVuSans.ttf"
+FEATURES = ["CEA", "白蛋白", "年龄"]
+
+
+def make_record(patient_id, death_probability=42.0):
+    return {
+        "patient_id": patient_id,
+        "feature_values": {"CEA": 5.0, "白蛋白": 38.0, "年龄": 60.0},
+        "death_probability": death_probability,
+        "feature_names": FEATURES,
+        "shap_values": np.array([0.1, -0.2, 0.05]),
+        "base_value": 0.35,
+    }
+
+
+class StubModel:
+    # 死亡概率 = CEA / 100，便于核对每条记录与输入行是否对应
+    def predict_proba(self, X):
+        p = X["CEA"].to_numpy(dtype=np.float64) / 100
+        return np.column_stack([1 - p, p])
+
+
+class StubExplanation:
+    def __init__(self, values):
+        self.values = values
+
+
+class StubExplainer:
+    expected_value = np.array([0.65, 0.35])
+
+    def __init__(self):
+        self.chunk_sizes = []
+
+    def __call__(self, X):
+        self.chunk_sizes.append(len(X))
+        values = X.to_numpy(dtype=np.float64) / 1000
+        # 与 TreeSHAP 的二分类输出一致：(样本, 特征, 类别)
+        return StubExplanation(np.stack([-values, values], axis=-1))
+
+
+def test_risk_band_categories_matches_scalar_risk_band():
+    probability = np.array([0.0, 29.9, 30.0, 30.1, 50.0, 70.0, 70.1, 100.0])
+    expected = [risk_band(p)[0] for p in probability]
+    assert list(risk_band_categories(probability)) == expected
+    assert expected[2] == "低风险" and expected[3] == "中等风险" and expected[6] == "高风险"
+
+
+def test_report_filename_sanitizes_id():
+    assert report_filename("P 001/a:b*c") == "report_P_001_a_b_c.png"
+    assert report_filename(7) == "report_7.png"
+    assert report_filename("P001", row=3) == "report_3_P001.png"
+
+
+def test_report_filenames_unique_ids_unchanged():
+    names, disambiguated = report_filenames(["A", "B", "C"])
+    assert names == ["report_A.png", "report_B.png", "report_C.png"]
+    assert not disambiguated
+
+
+@pytest.mark.parametrize("patient_ids", [["A", "B", "A"], ["A", np.nan, "C"], ["A", None, "C"], ["a b", "a_b", "c"]])
+def test_report_filenames_disambiguates_duplicate_or_missing_ids(patient_ids):
+    names, disambiguated = report_filenames(patient_ids, rows=[2, 5, 9])
+    assert disambiguated
+    assert len(set(names)) == len(names)
+    assert all(name.startswith(f"report_{row}") for name, row in zip(names, [2, 5, 9]))
+    assert "nan" not in "".join(names) and "None" not in "".join(names)
+
+
+def test_top_feature_contributions_orders_by_magnitude():
+    names = ["a", "b", "c", "d"]
+    features, values = top_feature_contributions(names, [0.1, -0.5, 0.3, -0.1], k=3)
+    assert features == ["b", "c", "a"]
+    np.testing.assert_allclose(values, [-0.5, 0.3, 0.1])
+    # 绝对值相同时保持原始顺序
+    features, _ = top_feature_contributions(names, [0.2, -0.2, 0.2, 0.0], k=4)
+    assert features == ["a", "b", "c", "d"]
+
+
+def test_render_reports_serial_keeps_input_order():
+    records = [make_record(patient_id) for patient_id in ["C", "A", "B", "E", "D"]]
+    results = list(render_reports(records, font_path=FONT, workers=0, batch_size=2))
+    assert [name for name, _ in results] == [report_filename(r["patient_id"]) for r in records]
+    for _, png in results:
+        assert Image.open(io.BytesIO(png)).format == "PNG"
+
+
+def test_export_reports_zip_counts_and_reports_progress(tmp_path):
+    records = [make_record(i, death_probability=10.0 * i) for i in range(1, 5)]
+    calls = []
+    path = tmp_path / "reports.zip"
+    count = export_reports_zip(records, path, progress=lambda done, total: calls.append((done, total)),
+                               font_path=FONT, workers=0)
+    assert count == 4
+    assert calls == [(1, 4), (2, 4), (3, 4), (4, 4)]
+    with zipfile.ZipFile(path) as zf:
+        assert zf.namelist() == [f"report_{i}.png" for i in range(1, 5)]
+
+
+def test_compute_report_records_aligns_ids_across_chunks():
+    X = pd.DataFrame({"CEA": np.arange(7, dtype=np.float64), "白蛋白": 40.0, "年龄": 60.0}, index=[3, 5, 8, 9, 12, 13, 20])
+    patient_ids = [f"P{i}" for i in range(7)]
+    explainer = StubExplainer()
+    records = list(compute_report_records(StubModel(), X, patient_ids=patient_ids, explainer=explainer, chunk_size=3))
+
+    assert explainer.chunk_sizes == [3, 3, 1]
+    assert [r["patient_id"] for r in records] == patient_ids
+    assert [r["filename"] for r in records] == [f"report_P{i}.png" for i in range(7)]
+    for i, record in enumerate(records):
+        assert record["feature_values"]["CEA"] == i
+        assert record["death_probability"] == pytest.approx(i)
+        np.testing.assert_allclose(record["shap_values"], X.iloc[i].to_numpy() / 1000)
+        assert record["base_value"] == 0.35
+
+
+def test_compute_report_records_rejects_mismatched_ids():
+    X = pd.DataFrame({"CEA": [1.0, 2.0], "白蛋白": 40.0, "年龄": 60.0})
+    with pytest.raises(ValueError):
+        list(compute_report_records(StubModel(), X, patient_ids=["A"], explainer=StubExplainer()))
+
+
+def test_duplicate_ids_give_unique_zip_entries(tmp_path):
+    X = pd.DataFrame({"CEA": [1.0, 2.0, 3.0], "白蛋白": 40.0, "年龄": 60.0})
+    filenames, _ = report_filenames(["A", "A", np.nan], rows=X.index + 1)
+    records = compute_report_records(StubModel(), X, patient_ids=["A", "A", np.nan], explainer=StubExplainer(),
+                                     filenames=filenames)
+    path = tmp_path / "reports.zip"
+    export_reports_zip(records, path, font_path=FONT, workers=0)
+    with zipfile.ZipFile(path) as zf:
+        assert zf.namelist() == ["report_1_A.png", "report_2_A.png", "report_3.png"]
@@ -0,0 +1,72 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from risk_grid import RiskGrid, _encode, model_fingerprint
+
+AXES = [np.array([0.0, 1.0, 3.0]), np.array([1.0, 2.0, 3.0, 4.0]), np.array([10.0, 20.0])]
+FEATURES = ["a", "tnm", "b"]
+TYPES = ["numerical", "categorical", "numerical"]
+
+
+def linear_risk(a, tnm, b):
+    # 对数值维度线性，多线性插值应当精确复现
+    return 0.05 + 0.1 * a + 0.1 * tnm + 0.01 * (b - 10)
+
+
+def make_grid(dtype="float16"):
+    a, tnm, b = np.meshgrid(*AXES, indexing="ij")
+    values = linear_risk(a, tnm, b)
+    values = _encode(values, dtype)
+    return RiskGrid(values, AXES, FEATURES, TYPES, dtype)
+
+
+def test_exact_values_at_knots():
+    grid = make_grid()
+    a, tnm, b = (m.ravel() for m in np.meshgrid(*AXES, indexing="ij"))
+    result = grid.lookup(np.column_stack([a, tnm, b]))
+    np.testing.assert_allclose(result, grid.values.astype(np.float64).ravel(), atol=1e-6)
+
+
+def test_interpolation_midpoints():
+    grid = make_grid()
+    points = np.array([[0.5, 2, 15.0], [2.0, 3, 12.5], [1.5, 1, 17.5]])
+    expected = linear_risk(points[:, 0], points[:, 1], points[:, 2])
+    np.testing.assert_allclose(grid.lookup(points), expected, atol=2e-3)
+
+
+def test_numeric_values_clamped_to_grid_edges():
+    grid = make_grid()
+    below = grid.lookup([[-5.0, 2, 0.0]])
+    above = grid.lookup([[100.0, 2, 99.0]])
+    np.testing.assert_allclose(below, grid.lookup([[0.0, 2, 10.0]]))
+    np.testing.assert_allclose(above, grid.lookup([[3.0, 2, 20.0]]))
+
+
+@pytest.mark.parametrize("raw, option", [(2.4, 2), (2.6, 3), (0, 1), (9, 4)])
+def test_categorical_snaps_to_nearest_option(raw, option):
+    grid = make_grid()
+    np.testing.assert_allclose(grid.lookup([[1.0, raw, 20.0]]), grid.lookup([[1.0, option, 20.0]]))
+
+
+def test_dataframe_and_single_lookup_use_feature_order():
+    grid = make_grid()
+    df = pd.DataFrame({"b": [15.0], "a": [0.5], "tnm": [2]})
+    expected = grid.lookup([[0.5, 2, 15.0]])
+    np.testing.assert_allclose(grid.lookup(df), expected)
+    assert grid.lookup_one({"tnm": 2, "b": 15.0, "a": 0.5}) == pytest.approx(expected[0])
+
+
+def test_uint8_storage_within_quantization_step():
+    grid = make_grid("uint8")
+    points = np.array([[0.5, 2, 15.0], [3.0, 4, 20.0]])
+    expected = linear_risk(points[:, 0], points[:, 1], points[:, 2])
+    np.testing.assert_allclose(grid.lookup(points), expected, atol=1 / 255)
+
+
+def test_model_fingerprint_is_file_sha256(tmp_path):
+    path = tmp_path / "model.pkl"
+    path.write_bytes(b"forest")
+    assert model_fingerprint(path) == hashlib.sha256(b"forest").hexdigest()
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from risk_grid import grid_axes, model_fingerprint, sample_inputs
+from surrogate_explainer import SurrogateExplainer, _hat_basis
+
+# 使用 feature_config 中的真实特征，拟合时按 grid_axes 取节点
+FEATURES = ["CEA", "年龄", "TNM分期"]
+BASE_VALUE = 0.3
+
+
+def true_tables(knots):
+    # 每个特征在节点上的已知贡献，节点之间线性插值
+    rng = np.random.default_rng(1)
+    return [rng.uniform(-0.05, 0.05, size=len(k)) for k in knots]
+
+
+class AdditiveExplainer:
+    # 精确 SHAP 值即为各特征的分段线性贡献（二维输出，与单输出模型一致）
+    expected_value = BASE_VALUE
+
+    def __init__(self, knots, tables):
+        self.knots = knots
+        self.tables = tables
+
+    def contributions(self, X):
+        values = X.to_numpy(dtype=np.float64)
+        return np.column_stack([np.interp(values[:, j], k, t) for j, (k, t) in enumerate(zip(self.knots, self.tables))])
+
+    def __call__(self, X):
+        return type("Explanation", (), {"values": self.contributions(X)})()
+
+
+class AdditiveModel:
+    def __init__(self, explainer):
+        self.explainer = explainer
+
+    def predict_proba(self, X):
+        p = BASE_VALUE + self.explainer.contributions(X).sum(axis=1)
+        return np.column_stack([1 - p, p])
+
+
+def make_surrogate(tables=None):
+    knots = grid_axes(FEATURES)
+    tables = true_tables(knots) if tables is None else tables
+    return SurrogateExplainer(FEATURES, knots, tables, BASE_VALUE)
+
+
+def test_hat_basis_rows_sum_to_one_and_knots_map_exactly():
+    knots = np.array([0.0, 1.0, 3.0, 7.0])
+    np.testing.assert_allclose(_hat_basis(knots, knots), np.eye(len(knots)))
+
+    x = np.array([-2.0, 0.5, 2.0, 6.9, 10.0])
+    basis = _hat_basis(x, knots)
+    np.testing.assert_allclose(basis.sum(axis=1), 1.0)
+    assert np.all(np.count_nonzero(basis, axis=1) <= 2)
+    # 区间内线性插值，超出范围时截断到端点
+    np.testing.assert_allclose(basis[1], [0.5, 0.5, 0.0, 0.0])
+    np.testing.assert_allclose(basis[2], [0.0, 0.5, 0.5, 0.0])
+    np.testing.assert_allclose(basis[0], [1.0, 0.0, 0.0, 0.0])
+    np.testing.assert_allclose(basis[4], [0.0, 0.0, 0.0, 1.0])
+
+
+def test_fit_recovers_piecewise_linear_contributions(tmp_path):
+    knots = grid_axes(FEATURES)
+    tables = true_tables(knots)
+    explainer = AdditiveExplainer(knots, tables)
+    X = sample_inputs(FEATURES, 4000, np.random.default_rng(1))
+    model_path = tmp_path / "model.pkl"
+    model_path.write_bytes(b"stub model")
+
+    surrogate = SurrogateExplainer.fit(AdditiveModel(explainer), X, explainer=explainer, chunk_size=1500,
+                                       model_path=str(model_path))
+
+    assert surrogate.base_value == pytest.approx(BASE_VALUE)
+    assert surrogate.model_sha256 == model_fingerprint(str(model_path))
+    for fitted, expected in zip(surrogate.tables, tables):
+        np.testing.assert_allclose(fitted, expected, atol=1e-3)
+    np.testing.assert_allclose(surrogate.explain(X), explainer.contributions(X), atol=1e-3)
+    fidelity = surrogate.fidelity
+    assert fidelity["r2"] > 0.999
+    assert fidelity["fast_path_rate"] > 0.99
+    assert fidelity["n_train"] + fidelity["n_holdout"] == len(X)
+
+
+def test_local_fidelity_drops_as_residual_grows():
+    surrogate = make_surrogate()
+    shap_vals = np.array([0.1, 0.2, -0.05])
+    exact_probability = BASE_VALUE + shap_vals.sum()
+    assert surrogate.local_fidelity(shap_vals, exact_probability)[0] == pytest.approx(1.0)
+
+    fidelity = surrogate.local_fidelity(np.tile(shap_vals, (4, 1)), exact_probability + np.array([0.0, 0.01, 0.1, 0.5]))
+    assert np.all(np.diff(fidelity) < 0)
+    # residual / (Σ|φ| + residual) = 0.1 / (0.35 + 0.1)
+    assert fidelity[2] == pytest.approx(1 - 0.1 / 0.45)
+
+
+def test_explain_one_uses_feature_order():
+    surrogate = make_surrogate()
+    values = {"TNM分期": 3, "年龄": 60.0, "CEA": 5.0}
+    shap_vals, fidelity = surrogate.explain_one(values, BASE_VALUE)
+    np.testing.assert_allclose(shap_vals, surrogate.explain([[5.0, 60.0, 3]])[0])
+    assert 0.0 <= fidelity <= 1.0
+
+
+def test_save_load_round_trip_keeps_model_sha256(tmp_path):
+    surrogate = make_surrogate()
+    surrogate.model_sha256 = "ab" * 32
+    surrogate.fidelity = {"r2": 0.9, "fast_path_rate": 0.8, "r2_fast_path": None}
+    path = tmp_path / "surrogate_explainer.pkl"
+    surrogate.save(path)
+
+    loaded = SurrogateExplainer.load(path)
+    assert loaded.model_sha256 == surrogate.model_sha256
+    assert loaded.feature_order == FEATURES
+    assert loaded.fidelity == surrogate.fidelity
+    assert loaded.threshold == surrogate.threshold
+    X = np.array([[5.0, 60.0, 3], [120.0, 30.0, 1]])
+    np.testing.assert_allclose(loaded.explain(X), surrogate.explain(X))